@@ -1,7 +1,14 @@
 import math
 from collections import deque
 
+from abalone.grid import encode_move, decode_move
+
+from . import weights
+from . import tracing
+from .cache import cached_evaluation, legal_moves
+
 node_count = 0
+WEIGHTS = weights.load('AI')
 
 ############################# MIN-MAX ##################################
 # Depth-limited Minimax search
@@ -20,15 +27,14 @@ def minimax(board, depth, maximizer):
 
     move = -1
 
-    successors = board.moves(maximizer)
+    successors = [decode_move(code) for code in legal_moves(board, maximizer)]
 
     for successor in successors:
         global node_count
         node_count = node_count + 1
 
         action = successor
-        state = board.deep_copy()
-        state.move(*action)
+        state = board.simulate(*action, trusted=True)
 
         temp = minimax(state, depth - 1, not maximizer)[0]
         if shouldReplace(temp):
@@ -39,7 +45,7 @@ def minimax(board, depth, maximizer):
 
 ############################# ALPHA-BETA ##################################
 # Depth-limited alphabeta search
-def alphabeta(board, depth, maximizer, alpha, beta):
+def alphabeta(board, depth, maximizer, alpha, beta, ply=0):
     if board.query.check_win(maximizer):
         return math.inf if maximizer else -math.inf, -1
     elif depth == 0:
@@ -53,18 +59,21 @@ def alphabeta(board, depth, maximizer, alpha, beta):
         def shouldReplace(x): return x < score
 
     move = -1
+    window = alpha, beta
+    cutoff = -1
+    children = 0
 
-    successors = list(board.moves(maximizer))
+    successors = [decode_move(code) for code in legal_moves(board, maximizer)]
 
     for successor in successors:
         global node_count
         node_count = node_count + 1
+        children += 1
 
         action = successor
-        state = board.deep_copy()
-        state.move(*action)
+        state = board.simulate(*action, trusted=True)
 
-        temp = alphabeta(state, depth - 1, not maximizer, alpha, beta)[0]
+        temp = alphabeta(state, depth - 1, not maximizer, alpha, beta, ply + 1)[0]
         
         if shouldReplace(temp):
             score = temp
@@ -74,8 +83,13 @@ def alphabeta(board, depth, maximizer, alpha, beta):
         else:
             beta = min(beta, temp)
         if alpha >= beta:
+            cutoff = children - 1
             break
 
+    if tracing.enabled:
+        tracing.record(tracing.AI_ALPHABETA, ply, depth, tracing.TT_NONE,
+                       -1 if move == -1 else encode_move(*move), cutoff, children,
+                       window[0], window[1], score)
     return score, move
 
 ############################# PVS (Move Ordering) ############################
@@ -95,7 +109,7 @@ def pvs(board, maximizer, alpha, beta, depth):
     
     move = -1
     
-    successors = list(board.moves(maximizer))
+    successors = [decode_move(code) for code in legal_moves(board, maximizer)]
     #ordered_successors = deque([])
     
     # # Order nodes based on sumito moves
@@ -123,8 +137,7 @@ def pvs(board, maximizer, alpha, beta, depth):
         node_count = node_count + 1
 
         action = successor
-        child = board.deep_copy()
-        child.move(*action)
+        child = board.simulate(*action, trusted=True)
 
         temp = 0
         if idx == 0:
@@ -144,17 +157,19 @@ def pvs(board, maximizer, alpha, beta, depth):
     return score, move
 
 ####################################### HEURISTIC ##########################################
+@cached_evaluation
 def heuristic(board):
     center_proximity = board.query.center_proximity(False) - board.query.center_proximity(True)
 
     # cohesion
     cohesion = 0
-    if abs(center_proximity) > 2:
-        cohesion = len(list(board.query.populations(False))) - len(list(board.query.populations(True)))
+    if abs(center_proximity) > WEIGHTS['cohesion_threshold']:
+        cohesion = len(board.query.components(False)) - len(board.query.components(True))
     
     # number of marbles
     marbles = 0
-    if abs(center_proximity) < 1.8:
-        marbles = board.query.marbles(True, True) * 100 - board.query.marbles(False, True) * 100
+    if abs(center_proximity) < WEIGHTS['marbles_threshold']:
+        marbles = board.query.marbles(True, True) - board.query.marbles(False, True)
     
-    return center_proximity + cohesion + marbles
\ No newline at end of file
+    return (WEIGHTS['center'] * center_proximity + WEIGHTS['cohesion'] * cohesion +
+            WEIGHTS['marbles'] * marbles)
\ No newline at end of file
@@ -4,26 +4,79 @@ Transposition table algorithms
 import random
 import math
 import csv
+from itertools import islice
+
+from abalone.grid import encode_move, decode_move
+from . import ordering
+from . import tracing
+from . import tablebase
+
+from . import weights
+from .cache import cached_evaluation
 
 ################################# TRANSPOSITION TABLE #################################
 node_count = 0
-zobrist = [[[0]*9]*9]*2
+WEIGHTS = weights.load('TT')
+zobrist = [[[0]*9 for _ in range(9)] for _ in range(2)]
+zobrist_side = 0
 table = {}
+# Entries kept in the table, unbounded when None. Past the cap, the least
+# recently stored PRUNE_FRACTION of the entries are evicted at once.
+TABLE_ENTRIES = None
+PRUNE_FRACTION = 0.25
+
+# Forward pruning, both off by default
+NULL_MOVE = False
+NULL_MOVE_REDUCTION = 2
+# Marbles above the game's GAME_OVER below which passing is no longer assumed to be safe
+NULL_MOVE_MIN_MARBLES = 2
+LATE_MOVE_REDUCTION = False
+LMR_MIN_DEPTH = 3
+LMR_MIN_INDEX = 4
+LMR_REDUCTION = 1
+
+# Quiescence search over pushing moves at the leaves
+QUIESCENCE = True
+QUIESCENCE_DEPTH = 4
+# Largest positional swing a single push is assumed to bring
+DELTA_MARGIN = 2
+
+# Null window width, scores being fractional
+WINDOW_EPSILON = 1e-6
+
+# Aspiration windows of search(): initial half-width, growth on every re-search
+# and half-width from which the window is fully opened
+ASPIRATION_WINDOW = 0.5
+ASPIRATION_GROWTH = 4
+ASPIRATION_MAX = 200
+
+# Interruption: when set, stop is polled every STOP_INTERVAL nodes and the
+# search is abandoned as soon as it returns true
+stop = None
+STOP_INTERVAL = 1024
+
+class SearchAborted(Exception):
+    pass
+
+stats = {'null_moves': 0, 'null_cutoffs': 0, 'reductions': 0, 're_searches': 0,
+         'quiescence_nodes': 0, 'delta_prunes': 0, 'fail_lows': 0, 'fail_highs': 0}
 
 def initialize_keys():
     '''
     Generate Zobrist hash keys
     '''
+    global zobrist_side
+    zobrist_side = random.getrandbits(64) - 2**63
     for p in range(0,2):
         for x in range(-4, 5):
             for z in range(-4, 5):
                 zobrist[p][x + 4][z + 4] = random.getrandbits(64)- 2**63
 
-def get_key(state):
+def get_key(state, player=None):
     '''
-    Get the state at the key
+    Get the state at the key, for some player to move if given
     '''
-    key = 0
+    key = zobrist_side if player else 0
     for player in state:
         p = 0
         if player: p = 0
@@ -36,6 +89,67 @@ def get_key(state):
 
     return key
 
+def encoded(move):
+    '''
+    Move as stored in a table entry: encoded, or -1 when there is none
+    '''
+    return -1 if move in (None, -1) else encode_move(*move)
+
+def decoded(move):
+    '''
+    Move of a table entry as a (block, direction) pair, or -1
+    '''
+    return -1 if move in (None, -1) else decode_move(move)
+
+def store(key, entry):
+    '''
+    Store a table entry, pruning the table when it outgrows its cap
+    '''
+    if TABLE_ENTRIES is not None and type(table) is dict:
+        # entries keep their place when stored again: move them to the end,
+        # so that the entries of the principal variation are evicted last
+        table.pop(key, None)
+        table[key] = entry
+        if len(table) > TABLE_ENTRIES:
+            prune()
+    else:
+        table[key] = entry
+
+def prune(entries=None):
+    '''
+    Evict the least recently stored entries of the table down to some amount
+    of entries or by PRUNE_FRACTION of its cap
+    '''
+    if entries is None:
+        entries = int(TABLE_ENTRIES * (1 - PRUNE_FRACTION))
+    for key in list(islice(table, max(0, len(table) - entries))):
+        del table[key]
+
+def reset_stats():
+    '''
+    Reset the search statistics
+    '''
+    for stat in stats:
+        stats[stat] = 0
+
+def null_move_allowed(board, maximizer, depth, ply, null):
+    '''
+    Whether passing may be tried: never at the root, twice in a row, too close
+    to the horizon or when the side to move is close to losing, where passing
+    would hide that every real move is bad.
+    '''
+    return (NULL_MOVE and null and ply > 0 and depth > NULL_MOVE_REDUCTION and
+            board.query.marbles(maximizer, True) > board.game_over + NULL_MOVE_MIN_MARBLES)
+
+def reduction(board, action, depth, idx):
+    '''
+    Depth reduction for a quiet move late in the ordered list
+    '''
+    if (LATE_MOVE_REDUCTION and depth >= LMR_MIN_DEPTH and idx >= LMR_MIN_INDEX and
+            not board.query.pushed(*action)):
+        return LMR_REDUCTION
+    return 0
+
 def output():
     '''
     Output file
@@ -49,24 +163,35 @@ def output():
 
 ############################# ALPHA-BETA + MOVE ORDER ##################################
 # Depth-limited alphabeta search
-def alphabeta(board, depth, maximizer, alpha, beta):
+def alphabeta(board, depth, maximizer, alpha, beta, ply=0, null=True):
     tt_entry = {'move': None, 'value': None, 'flag': None, 'depth': None}
-    key = get_key(board.deep_copy(True))
+    key = get_key(board.deep_copy(True), maximizer)
     
     # lookup
-    if key in table and table[key]['depth'] >= depth:
-        tt_entry = table[key]
+    stored = table.get(key)
+    hash_move = stored['move'] if stored is not None else None
+    if stored is not None and stored['depth'] >= depth:
+        tt_entry = stored
         move, flag, value = tt_entry['move'], tt_entry['flag'], tt_entry['value']
 
         if flag == 'lower':
-            return max(alpha, value), move
+            return max(alpha, value), decoded(move)
         elif flag == 'upper':
-            return min(beta, value), move
+            return min(beta, value), decoded(move)
     
     if board.query.check_win(maximizer):
         return math.inf if maximizer else -math.inf, -1
     elif depth == 0:
-        return heuristic(board), -1
+        return leaf(board, maximizer, alpha, beta), -1
+
+    # null move
+    if null_move_allowed(board, maximizer, depth, ply, null):
+        stats['null_moves'] += 1
+        temp = alphabeta(board, depth - 1 - NULL_MOVE_REDUCTION, not maximizer,
+                         alpha, beta, ply + 1, False)[0]
+        if (maximizer and temp >= beta) or (not maximizer and temp <= alpha):
+            stats['null_cutoffs'] += 1
+            return temp, -1
 
     if maximizer:
         score = -math.inf
@@ -77,18 +202,25 @@ def alphabeta(board, depth, maximizer, alpha, beta):
 
     move = -1
 
-    successors = list(board.moves(maximizer))
-    successors = sorted(successors, key=lambda x: len(x[0]), reverse=True)
+    successors = ordering.staged_moves(board, maximizer, ply, hash_move)
 
-    for successor in successors:
+    for idx, successor in enumerate(successors):
         global node_count
         node_count = node_count + 1
 
         action = successor
-        state = board.deep_copy()
-        state.move(*action)
+        state = board.simulate(*action, trusted=True)
 
-        temp = alphabeta(state, depth - 1, not maximizer, alpha, beta)[0]
+        # late move reduction, re-searched to full depth if it fails high
+        r = reduction(board, action, depth, idx)
+        if r:
+            stats['reductions'] += 1
+            temp = alphabeta(state, depth - 1 - r, not maximizer, alpha, beta, ply + 1)[0]
+            if (temp > alpha) if maximizer else (temp < beta):
+                stats['re_searches'] += 1
+                r = 0
+        if not r:
+            temp = alphabeta(state, depth - 1, not maximizer, alpha, beta, ply + 1)[0]
         
         if shouldReplace(temp):
             score = temp
@@ -98,11 +230,12 @@ def alphabeta(board, depth, maximizer, alpha, beta):
         else:
             beta = min(beta, temp)
         if alpha >= beta:
+            ordering.cutoff(board, action, ply, depth)
             break
     
     # store
     tt_entry['value'] = score
-    tt_entry['move'] = move
+    tt_entry['move'] = encoded(move)
     if score <= alpha:
         tt_entry['flag'] = 'upper'
     elif score >= beta:
@@ -110,91 +243,230 @@ def alphabeta(board, depth, maximizer, alpha, beta):
     
     tt_entry['depth'] = depth
 
-    table[key] = tt_entry
+    store(key, tt_entry)
     return score, move
 
 ################################ PVS + MOVE ORDER ##################################
-# Depth-limited principal variation search
-def pvs(board, maximizer, alpha, beta, depth):
-    tt_entry = {'move': None, 'value': None, 'flag': None, 'depth': None}
-    
-    key = get_key(board.deep_copy(True))
-    
+# Depth-limited principal variation search, in negamax form: scores are from
+# the point of view of the player to move. Stored values are exact when they
+# fell inside the window, lower bounds on fail high and upper bounds on fail low.
+def pvs(board, maximizer, alpha, beta, depth, ply=0, null=True):
+    key = get_key(board.deep_copy(True), maximizer)
+    alpha_orig = alpha
+
     # lookup
-    if key in table and table[key]['depth'] >= depth:
-        tt_entry = table[key]
-        move, flag, value = tt_entry['move'], tt_entry['flag'], tt_entry['value']
+    hash_move = None
+    tt_entry = table.get(key)
+    if tt_entry is not None:
+        hash_move = tt_entry['move']
+        if tt_entry['depth'] >= depth:
+            flag, value = tt_entry['flag'], tt_entry['value']
+            if flag == 'lower':
+                alpha = max(alpha, value)
+            elif flag == 'upper':
+                beta = min(beta, value)
+            if flag == 'exact' or alpha >= beta:
+                if tracing.enabled:
+                    tracing.record(tracing.TT_PVS, ply, depth, tracing.TT_CUTOFF, hash_move,
+                                   -1, 0, alpha_orig, beta, value)
+                return value, decoded(hash_move)
 
-        if flag == 'lower':
-            return max(-alpha, value), move
-        elif flag == 'upper':
-            return min(-beta, value), move
+    # the opponent's last move won the game
+    if board.query.check_win(not maximizer):
+        return -math.inf, -1
+    # exact result of an endgame
+    if tablebase.PROBE:
+        value = tablebase.score(board, maximizer)
+        if value is not None:
+            return value, -1
+    if depth == 0:
+        if maximizer:
+            return leaf(board, maximizer, alpha, beta), -1
+        return -leaf(board, maximizer, -beta, -alpha), -1
 
-    if board.query.check_win(maximizer):
-        return math.inf if maximizer else -math.inf, -1
-    elif depth == 0:
-        return -heuristic(board), -1
-    
-    if maximizer:
-        score = -math.inf
-        def shouldReplace(x): return x > score
-    else:
-        score = math.inf
-        def shouldReplace(x): return x < score
-    
+    # null move
+    if beta < math.inf and null_move_allowed(board, maximizer, depth, ply, null):
+        stats['null_moves'] += 1
+        temp = -pvs(board, not maximizer, -beta, -beta + WINDOW_EPSILON,
+                    depth - 1 - NULL_MOVE_REDUCTION, ply + 1, False)[0]
+        if temp >= beta:
+            stats['null_cutoffs'] += 1
+            return temp, -1
+
+    score = -math.inf
     move = -1
-    
-    successors = list(board.moves(maximizer))
-    successors = sorted(successors, key=lambda x: len(x[0]), reverse=True)
+    cutoff = -1
+    children = 0
+
+    successors = ordering.staged_moves(board, maximizer, ply, hash_move)
 
     for idx, successor in enumerate(successors):
         global node_count
         node_count = node_count + 1
+        children += 1
+
+        if stop is not None and not node_count % STOP_INTERVAL and stop():
+            raise SearchAborted()
 
         action = successor
-        child = board.deep_copy()
-        child.move(*action)
+        child = board.simulate(*action, trusted=True)
 
-        temp = 0
-        if idx == 0:
-            temp = -pvs(child, not maximizer, -beta, -alpha, depth - 1)[0]
+        if idx == 0 or alpha == -math.inf:
+            temp = -pvs(child, not maximizer, -beta, -alpha, depth - 1, ply + 1)[0]
         else:
-            temp = -pvs(child, not maximizer, -alpha - 1, -alpha, depth - 1)[0]
-            if alpha < score < beta:
-                temp = -pvs(child, not maximizer, -beta, -score, depth - 1)[0]
-        
-        if shouldReplace(temp):
+            # late move reduction, re-searched to full depth if it fails high
+            r = reduction(board, action, depth, idx)
+            if r:
+                stats['reductions'] += 1
+            temp = -pvs(child, not maximizer, -alpha - WINDOW_EPSILON, -alpha,
+                        depth - 1 - r, ply + 1)[0]
+            if r and temp > alpha:
+                stats['re_searches'] += 1
+                temp = -pvs(child, not maximizer, -alpha - WINDOW_EPSILON, -alpha,
+                            depth - 1, ply + 1)[0]
+            # null window failed high: search again with the full window
+            if alpha < temp < beta:
+                temp = -pvs(child, not maximizer, -beta, -alpha, depth - 1, ply + 1)[0]
+
+        if temp > score:
             score = temp
             move = action
         alpha = max(alpha, score)
         if alpha >= beta:
+            ordering.cutoff(board, action, ply, depth)
+            cutoff = idx
             break
-    
+
     # store
-    tt_entry['value'] = score
-    tt_entry['move'] = move
-    if score <= alpha:
-        tt_entry['flag'] = 'upper'
+    if score <= alpha_orig:
+        flag = 'upper'
     elif score >= beta:
-        tt_entry['flag'] = 'lower'
-    
-    tt_entry['depth'] = depth
+        flag = 'lower'
+    else:
+        flag = 'exact'
+    store(key, {'move': encoded(move), 'value': score, 'flag': flag, 'depth': depth})
+    if tracing.enabled:
+        tracing.record(tracing.TT_PVS, ply, depth,
+                       tracing.TT_MISS if tt_entry is None else tracing.TT_HIT,
+                       encoded(move), cutoff, children,
+                       alpha_orig, beta, score)
+    return score, move
+
+# Iterative deepening over pvs, each iteration searched within an aspiration
+# window around the previous score and widened on fail low or fail high. An
+# interrupted iteration leaves the result of the previous one. With the
+# experimental tablebase probes enabled, endgames held by a table are played
+# from it, and probed at every node of the search.
+def search(board, maximizer, depth):
+    global stop
+    # endgames held by a tablebase need no search
+    if tablebase.PROBE:
+        result = tablebase.best_move(board, maximizer)
+        if result is not None:
+            return result
+
+    # the first iteration always completes
+    poll, stop = stop, None
+    try:
+        score, move = pvs(board, maximizer, -math.inf, math.inf, 1)
+    finally:
+        stop = poll
+
+    for d in range(2, depth + 1):
+        try:
+            score, move = aspiration(board, maximizer, d, score)
+        except SearchAborted:
+            break
 
-    table[key] = tt_entry
     return score, move
 
+# One iteration of search at depth d, around the score of the previous one
+def aspiration(board, maximizer, d, score):
+    delta = ASPIRATION_WINDOW
+    alpha, beta = -math.inf, math.inf
+    if abs(score) < math.inf:
+        alpha, beta = score - delta, score + delta
+
+    while True:
+        temp, temp_move = pvs(board, maximizer, alpha, beta, d)
+        if temp <= alpha and alpha > -math.inf:
+            stats['fail_lows'] += 1
+            delta *= ASPIRATION_GROWTH
+            alpha = score - delta if delta < ASPIRATION_MAX else -math.inf
+        elif temp >= beta and beta < math.inf:
+            stats['fail_highs'] += 1
+            delta *= ASPIRATION_GROWTH
+            beta = score + delta if delta < ASPIRATION_MAX else math.inf
+        else:
+            break
+
+    return temp, temp_move
+
+############################### QUIESCENCE SEARCH ##################################
+# Leaf score, extended through pushing moves when quiescence is enabled
+def leaf(board, maximizer, alpha, beta):
+    if QUIESCENCE:
+        return quiesce(board, maximizer, alpha, beta, QUIESCENCE_DEPTH)
+    return heuristic(board)
+
+# Capture-only search with stand-pat cutoffs and delta pruning
+def quiesce(board, maximizer, alpha, beta, depth):
+    stats['quiescence_nodes'] += 1
+    if board.query.check_win(not maximizer):
+        return -math.inf if maximizer else math.inf
+
+    # stand pat: the side to move may always decline to push
+    score = heuristic(board)
+    if depth == 0:
+        return score
+    if maximizer:
+        if score >= beta:
+            return score
+        alpha = max(alpha, score)
+    else:
+        if score <= alpha:
+            return score
+        beta = min(beta, score)
+
+    stand_pat = score
+    captures = sorted(board.captures(maximizer), key=lambda m: ordering.push_score(board, m),
+                      reverse=True)
+
+    for action in captures:
+        # delta pruning: skip pushes which cannot bring the score back into the window
+        push_off, _ = ordering.push_score(board, action)
+        delta = DELTA_MARGIN + (WEIGHTS['marbles'] if push_off else 0)
+        if (stand_pat + delta < alpha) if maximizer else (stand_pat - delta > beta):
+            stats['delta_prunes'] += 1
+            continue
+
+        temp = quiesce(board.simulate(*action, trusted=True), not maximizer, alpha, beta, depth - 1)
+
+        if maximizer:
+            score = max(score, temp)
+            alpha = max(alpha, temp)
+        else:
+            score = min(score, temp)
+            beta = min(beta, temp)
+        if alpha >= beta:
+            break
+
+    return score
+
 ####################################### HEURISTIC ##########################################
+@cached_evaluation
 def heuristic(board):
     center_proximity = board.query.center_proximity(False) - board.query.center_proximity(True)
 
     # cohesion
     cohesion = 0
-    if abs(center_proximity) > 2:
-        cohesion = len(list(board.query.populations(False))) - len(list(board.query.populations(True)))
+    if abs(center_proximity) > WEIGHTS['cohesion_threshold']:
+        cohesion = len(board.query.components(False)) - len(board.query.components(True))
     
     # number of marbles
     marbles = 0
-    if abs(center_proximity) < 1.5:
-        marbles = board.query.marbles(True, True) * 100 - board.query.marbles(False, True) * 100
+    if abs(center_proximity) < WEIGHTS['marbles_threshold']:
+        marbles = board.query.marbles(True, True) - board.query.marbles(False, True)
     
-    return center_proximity + cohesion + marbles
\ No newline at end of file
+    return (WEIGHTS['center'] * center_proximity + WEIGHTS['cohesion'] * cohesion +
+            WEIGHTS['marbles'] * marbles)
\ No newline at end of file
@@ -0,0 +1,110 @@
+'''
+Bounded caches shared by every searcher
+'''
+from array import array
+from collections import OrderedDict
+from functools import wraps
+
+# Entries of the shared caches, read on every insertion so that they can be
+# changed at any time
+EVALUATION_CACHE_SIZE = 2**18
+MOVE_CACHE_SIZE = 2**16
+
+
+class LRUCache(object):
+    '''
+    Bounded mapping that evicts the least recently used entry once it is full
+    and counts its hits and misses. The bound is a size, or a function
+    returning the size in force.
+    '''
+    def __init__(self, maxsize):
+        self.bound = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def maxsize(self):
+        return self.bound() if callable(self.bound) else self.bound
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        '''
+        Returns the entry at the key, marking it as recently used.
+        '''
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        '''
+        Stores the entry at the key, evicting the oldest ones if full.
+        '''
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        maxsize = self.maxsize
+        while len(self.entries) > maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {'size': len(self), 'maxsize': self.maxsize, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hit_rate}
+
+
+evaluations = LRUCache(lambda: EVALUATION_CACHE_SIZE)
+move_lists = LRUCache(lambda: MOVE_CACHE_SIZE)
+
+
+def cached_evaluation(func):
+    '''
+    Caches an evaluation function in the shared evaluation cache, keyed by the
+    position hash. Each function gets its own entries so heuristics with
+    different weights never share scores.
+    '''
+    name = func.__module__ + '.' + func.__name__
+
+    @wraps(func)
+    def wrapper(board):
+        key = (name, board.key)
+        value = evaluations.get(key)
+        if value is None:
+            value = func(board)
+            evaluations.put(key, value)
+        return value
+    return wrapper
+
+
+def legal_moves(board, player):
+    '''
+    Returns the encoded moves of some player, in the order of the move
+    generator, from the shared move cache keyed by the position hash. The
+    packed array is shared: callers which modify it must copy it first.
+    '''
+    key = (board.key, player)
+    moves = move_lists.get(key)
+    if moves is None:
+        moves = array('H', board.moves(player, encoded=True))
+        move_lists.put(key, moves)
+    return moves
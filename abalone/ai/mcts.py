@@ -1,33 +1,163 @@
 import math
-import random
+from array import array
+
+from abalone.grid import Hex, decode_move
+from .TT import heuristic
+from . import tablebase
+from .cache import legal_moves
+
+# Progressive widening, off by default: a node only admits children, in order
+# of their prior, up to WIDENING_SCALE * (visits + 1) ** WIDENING_EXPONENT
+PROGRESSIVE_WIDENING = False
+WIDENING_SCALE = 1.0
+WIDENING_EXPONENT = 0.5
+
+# Weight of the move prior in the selection score, none by default
+PRIOR_WEIGHT = 0.0
+# Cheap move evaluation behind the prior: push-offs, pushed marbles and the
+# distance gained towards the center
+PRIOR_PUSH_OFF = 3.0
+PRIOR_SUMITO = 1.0
+PRIOR_CENTER = 0.5
+CENTER = Hex(0, 0)
+
+def MoveScore(state, move):
+    """ Cheap evaluation of an encoded move for the player making it.
+    """
+    block, direction = decode_move(move)
+    enemies = state.query.pushed(block, direction)
+    push_off = bool(enemies) and enemies[-1] + direction not in state
+    center = sum(hex.distance(CENTER) - (hex + direction).distance(CENTER) for hex in block)
+    return PRIOR_PUSH_OFF * push_off + PRIOR_SUMITO * len(enemies) + PRIOR_CENTER * center
+
+def Priors(state, moves):
+    """ Prior probability of each of some encoded moves, as a softmax over their scores.
+    """
+    scores = [MoveScore(state, m) for m in moves]
+    top = max(scores, default=0)
+    weights = [math.exp(score - top) for score in scores]
+    total = sum(weights)
+    return {m: w / total for m, w in zip(moves, weights)}
+
+# Rollouts stop after ROLLOUT_DEPTH plies (None for no cap), or as soon as one
+# side is DECISIVE_MARBLES marbles ahead, which counts as a win for that side.
+# Capped rollouts are scored by the heuristic, mapped to a win probability by
+# a logistic curve of slope HEURISTIC_SCALE.
+ROLLOUT_DEPTH = 20
+DECISIVE_MARBLES = 3
+HEURISTIC_SCALE = 0.5
+
+def Outcome(state):
+    """ Probability that White wins from the final state of a rollout.
+    """
+    if state.query.check_win(True):
+        return 1.0
+    if state.query.check_win(False):
+        return 0.0
+    balance = state.query.marbles(True, True) - state.query.marbles(False, True)
+    if DECISIVE_MARBLES is not None and abs(balance) >= DECISIVE_MARBLES:
+        return 1.0 if balance > 0 else 0.0
+    x = max(-50.0, min(50.0, HEURISTIC_SCALE * heuristic(state)))
+    return 1 / (1 + math.exp(-x))
+
+def TablebaseOutcome(state, player):
+    """ Probability that White wins from a state with player to move, from the tablebases,
+        or None when they do not hold the state.
+    """
+    result = tablebase.probe(state, player)
+    if result is None:
+        return None
+    if result[0] == tablebase.DRAW:
+        return 0.5
+    return 1.0 if (result[0] == tablebase.WIN) == player else 0.0
+
+def Decisive(state):
+    """ Whether one side is far enough ahead in marbles to end a rollout.
+    """
+    if DECISIVE_MARBLES is None:
+        return False
+    return abs(state.query.marbles(True, True) - state.query.marbles(False, True)) >= DECISIVE_MARBLES
+
+# RAVE, off by default: children also keep all-moves-as-first statistics,
+# counting their move whenever the same player played it later in a
+# simulation, blended into the selection score with a weight which decays as
+# sqrt(RAVE_EQUIVALENCE / (3 * visits + RAVE_EQUIVALENCE))
+RAVE = False
+RAVE_EQUIVALENCE = 300
+
+# Nodes kept in the tree, unbounded when None. Once the tree holds MAX_NODES
+# nodes it stops growing and simulations roll out from the node they reach.
+MAX_NODES = None
+# Nodes in the tree of the last search
+node_count = 0
 
 class Node:
     """ A node in the game tree. Note wins is always from the viewpoint of playerJustMoved.
-        Crashes if state not specified.
+        Crashes if state not specified. Untried moves are packed in an array of codes.
     """
+    __slots__ = ('move', 'parentNode', 'childNodes', 'wins', 'visits', 'raveWins', 'raveVisits',
+                 'playerJustMoved', 'prior', 'untriedMoves', 'priors')
+
     def __init__(self, move = None, parent = None, state = None, player = None):
-        self.move = move # the move that got us to this node - "None" for the root node
+        self.move = move # the encoded move that got us to this node - "None" for the root node
         self.parentNode = parent # "None" for the root node
         self.childNodes = []
         self.wins = 0
         self.visits = 0
+        self.raveWins = 0
+        self.raveVisits = 0
         self.playerJustMoved = player # the only part of the state that the Node needs later
-        self.untriedMoves = list(state.moves(self.playerJustMoved)) # future child nodes
+        self.prior = 0.0 # prior probability of the move, given by the parent node
+        if state.query.check_win(player): # future child nodes, none once the game is over
+            self.untriedMoves = array('H')
+        else:
+            self.untriedMoves = array('H', legal_moves(state, not player)) # a copy: tried moves are removed
+        self.priors = {}
+        if PROGRESSIVE_WIDENING or PRIOR_WEIGHT:
+            # most promising moves first, to be admitted first when widening
+            self.priors = Priors(state, self.untriedMoves)
+            self.untriedMoves = array('H', sorted(self.untriedMoves, key = self.priors.get, reverse = True))
+
+    def CanExpand(self):
+        """ Whether a child can be added: there are untried moves and, when widening,
+            the node has been visited enough to admit one more child.
+        """
+        if not self.untriedMoves:
+            return False
+        if PROGRESSIVE_WIDENING:
+            return len(self.childNodes) < WIDENING_SCALE * (self.visits + 1) ** WIDENING_EXPONENT
+        return True
+
+    def UCB(self, c):
+        """ Selection score of a child: UCB1, with its mean blended with the AMAF mean under
+            RAVE, plus the prior of its move with a weight decaying as the child gets visited.
+        """
+        mean = c.wins/c.visits
+        if RAVE and c.raveVisits:
+            beta = math.sqrt(RAVE_EQUIVALENCE / (3*c.visits + RAVE_EQUIVALENCE))
+            mean = (1 - beta) * mean + beta * c.raveWins/c.raveVisits
+        score = mean + math.sqrt(2*math.log(self.visits)/c.visits)
+        if PRIOR_WEIGHT:
+            score += PRIOR_WEIGHT * c.prior * math.sqrt(self.visits) / (1 + c.visits)
+        return score
         
     def UCTSelectChild(self):
         """ Use the UCB1 formula to select a child node. Often a constant UCTK is applied so we have
             lambda c: c.wins/c.visits + UCTK * sqrt(2*log(self.visits)/c.visits to vary the amount of
             exploration versus exploitation.
         """
-        s = sorted(self.childNodes, key = lambda c: c.wins/c.visits + math.sqrt(2*math.log(self.visits)/c.visits))[-1]
+        s = sorted(self.childNodes, key = self.UCB)[-1]
         return s
     
     def AddChild(self, m, s):
         """ Remove m from untriedMoves and add a new child node for this move.
             Return the added child node
         """
-        n = Node(move = m, parent = self, state = s)
+        n = Node(move = m, parent = self, state = s, player = not self.playerJustMoved)
+        n.prior = self.priors.get(m, 0.0)
         self.untriedMoves.remove(m)
+        if not self.untriedMoves:
+            self.priors = {} # only needed for the moves left to try
         self.childNodes.append(n)
         return n
     
@@ -37,6 +167,17 @@ class Node:
         self.visits += 1
         self.wins += result
 
+    def UpdateRAVE(self, played, result):
+        """ Update the AMAF statistics of the children whose move was played later in the
+            simulation by the same player. played maps each player to the moves it played.
+            result is from the viewpoint of the player to move at this node.
+        """
+        moves = played[not self.playerJustMoved]
+        for c in self.childNodes:
+            if c.move in moves:
+                c.raveVisits += 1
+                c.raveWins += result
+
     def __repr__(self):
         return "[M:" + str(self.move) + " W/V:" + str(self.wins) + "/" + str(self.visits) + " U:" + str(self.untriedMoves) + "]"
 
@@ -58,45 +199,69 @@ class Node:
             s += str(c) + "\n"
         return s
 
-def UCT(rootstate, itermax, player, verbose = False):
-    """ Conduct a UCT search for itermax iterations starting from rootstate.
+def UCT(rootstate, itermax, player, verbose = False, rng = None, stop = None):
+    """ Conduct a UCT search for itermax iterations starting from rootstate, with player to move.
         Return the best move from the rootstate.
-        Assumes 2 alternating players (player 1 starts), with game results in the range [0.0, 1.0]."""
+        Random choices are drawn from rng, or else from the random generator of the game.
+        If given, stop is polled before each iteration after the first and ends the search early.
+        Assumes 2 alternating players, with game results in the range [0.0, 1.0]."""
 
-    rootnode = Node(state = rootstate, player = player)
+    global node_count
+    rng = rng or rootstate.rng
+    if tablebase.PROBE: # endgames held by a tablebase need no search
+        result = tablebase.best_move(rootstate, player)
+        if result is not None:
+            return result[1]
+    rootnode = Node(state = rootstate, player = not player)
+    node_count = 1
 
     for sim in range(itermax):
-        print("Simulation ", sim + 1, "...")
+        if stop is not None and sim and stop():
+            break
+        if verbose: print("Simulation ", sim + 1, "...")
         node = rootnode
         state = rootstate.deep_copy()
 
         # Select
-        while node.untriedMoves == [] and node.childNodes != []: # node is fully expanded and non-terminal
+        while not node.CanExpand() and node.childNodes != []: # node is fully expanded (or widened) and non-terminal
             node = node.UCTSelectChild()
-            state.move(*node.move)
-            # node.playerJustMoved = not node.playerJustMoved
+            state.apply(node.move)
 
         # Expand
-        if node.untriedMoves != []: # if we can expand (i.e. state/node is non-terminal)
-            m = random.choice(node.untriedMoves) 
-            state.move(*m)
-            # node.playerJustMoved = not node.playerJustMoved
+        if node.CanExpand() and (MAX_NODES is None or node_count < MAX_NODES): # if we can expand (i.e. state/node is non-terminal) and the tree has room
+            m = node.untriedMoves[0] if PROGRESSIVE_WIDENING else rng.choice(node.untriedMoves)
+            state.apply(m)
             node = node.AddChild(m, state) # add child and descend tree
+            node_count += 1
 
-        # Rollout - this can often be made orders of magnitude quicker using a state.GetRandomMove() function
-        while state.query.check_win(node.playerJustMoved) == False: # while state is non-terminal
-            state.move(*random.choice(list(state.moves(node.playerJustMoved, rnd=True))))
-            # node.playerJustMoved = not node.playerJustMoved
+        # Rollout - players alternate random moves until the game is over, one side
+        # is decisively ahead, the depth cap is reached or a tablebase knows the result
+        mover = node.playerJustMoved
+        plies = 0
+        played = {True: set(), False: set()} # moves of each player below the current node
+        white = None
+        while not state.query.check_win(mover) and not Decisive(state):
+            if tablebase.PROBE:
+                white = TablebaseOutcome(state, not mover)
+                if white is not None:
+                    break
+            if ROLLOUT_DEPTH is not None and plies >= ROLLOUT_DEPTH:
+                break
+            mover = not mover
+            m = rng.choice(list(state.moves(mover, rnd=True, rng=rng, encoded=True)))
+            state.apply(m)
+            if RAVE: played[mover].add(m)
+            plies += 1
+        if white is None:
+            white = Outcome(state)
 
         # Backpropagate
         while node != None: # backpropagate from the expanded node and work back to the root node
-            status = 0
-            if state.query.check_win(node.playerJustMoved):
-                status = 1.0
-            else:
-                status = 0.0
-
-            node.Update(status) # state is terminal. Update node with result from POV of node.playerJustMoved
+            status = white if node.playerJustMoved else 1.0 - white
+            node.Update(status) # Update node with result from POV of node.playerJustMoved
+            if RAVE:
+                node.UpdateRAVE(played, 1.0 - status)
+                if node.move is not None: played[node.playerJustMoved].add(node.move)
             node = node.parentNode
     
-    return sorted(rootnode.childNodes, key = lambda c: c.visits)[-1].move # return the move that was most visited
\ No newline at end of file
+    return decode_move(sorted(rootnode.childNodes, key = lambda c: c.visits)[-1].move) # return the move that was most visited
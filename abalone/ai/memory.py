@@ -0,0 +1,103 @@
+'''
+Memory accounting of the engines
+
+Reports the live size of every structure the searchers keep between nodes
+(transposition table, move ordering tables, evaluation and move caches and
+the tree of the last MCTS search) along with the resident and peak resident
+memory of the process. Engines which are not imported are left out rather
+than imported.
+
+The peak is per move when reset_peak() is called before each search, which
+only Linux supports; elsewhere it is the peak of the whole process.
+
+Sizes are bounded with the caps of each structure:
+    - TT.TABLE_ENTRIES: the least recently stored entries are evicted past it.
+    - mcts.MAX_NODES: the tree stops growing at it, nothing is pruned; the
+      simulations roll out from the node they reach.
+    - cache.EVALUATION_CACHE_SIZE and cache.MOVE_CACHE_SIZE: least recently
+      used evaluations and move lists are evicted, as soon as the next entry
+      is stored when a cap is lowered.
+'''
+import os
+import re
+import sys
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+from . import cache
+
+
+def rss():
+    '''
+    Resident memory of the process in bytes, or None where unknown
+    '''
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def reset_peak():
+    '''
+    Start measuring the peak resident memory afresh, which only Linux allows.
+    Returns whether it did.
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss():
+    '''
+    Peak resident memory in bytes since the last reset_peak() where the
+    platform allows it, of the whole process otherwise, or None where unknown
+    '''
+    try:
+        with open('/proc/self/status') as status:
+            return int(re.search(r'VmHWM:\s+(\d+) kB', status.read()).group(1)) * 1024
+    except (OSError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def report():
+    '''
+    Live size and cap of the engine structures, and memory of the process
+    '''
+    structures = {'evaluations': {'entries': len(cache.evaluations),
+                                  'cap': cache.evaluations.maxsize,
+                                  'evictions': cache.evaluations.evictions},
+                  'moves': {'entries': len(cache.move_lists),
+                            'cap': cache.move_lists.maxsize,
+                            'evictions': cache.move_lists.evictions}}
+
+    TT = sys.modules.get('abalone.ai.TT')
+    if TT is not None and type(TT.table) is dict:
+        structures['table'] = {'entries': len(TT.table), 'cap': TT.TABLE_ENTRIES}
+
+    ordering = sys.modules.get('abalone.ai.ordering')
+    if ordering is not None:
+        structures['killers'] = {'entries': sum(len(slots) for slots in ordering.killers.values()),
+                                 'cap': None}
+        structures['history'] = {'entries': len(ordering.history), 'cap': None}
+
+    mcts = sys.modules.get('abalone.ai.mcts')
+    if mcts is not None:
+        structures['mcts'] = {'entries': mcts.node_count, 'cap': mcts.MAX_NODES}
+
+    current, peak = rss(), peak_rss()
+    if current is not None and peak is not None:
+        # the two are sampled differently
+        peak = max(current, peak)
+    return {'structures': structures, 'rss': current, 'peak_rss': peak}
@@ -0,0 +1,83 @@
+'''
+Move ordering for the alpha-beta searchers
+'''
+from abalone.grid import encode_move, decode_move
+from .cache import legal_moves
+
+KILLER_SLOTS = 2
+
+# Encoded quiet moves which caused a beta cutoff, per ply
+killers = {}
+# Cutoff scores of quiet moves, keyed by encoded move
+history = {}
+# Quiet moves with equal scores are tried from this index of the generated
+# list on, wrapping around, so that parallel searches order them differently
+rotation = 0
+
+def clear():
+    '''
+    Forget the killers and history of previous searches
+    '''
+    killers.clear()
+    history.clear()
+
+def push_score(board, move):
+    '''
+    Ordering score of a pushing move: push-offs first, then by pushed marbles
+    '''
+    block, direction = move
+    enemies = board.query.pushed(block, direction)
+    push_off = bool(enemies) and enemies[-1] + direction not in board
+    return push_off, len(enemies)
+
+def cutoff(board, move, ply, depth):
+    '''
+    Record a quiet move which caused a beta cutoff
+    '''
+    if board.query.pushed(*move):
+        return
+    move = encode_move(*move)
+    slots = killers.setdefault(ply, [])
+    if move not in slots:
+        slots.insert(0, move)
+        del slots[KILLER_SLOTS:]
+    history[move] = history.get(move, 0) + depth * depth
+
+def staged_moves(board, player, ply, hash_move=None):
+    '''
+    Yield the moves of some player in stages, generating each stage only once
+    the previous one is exhausted:
+        - the encoded hash move stored in the transposition table, if it is legal
+        here: a key collision could have stored a move from another position.
+        - pushing moves, push-offs first.
+        - killer moves of this ply which are legal here.
+        - the remaining quiet moves by history, longer blocks first on ties,
+        then from the `rotation` index of the generated list on.
+    '''
+    done = set()
+    if hash_move not in (None, -1):
+        move = decode_move(hash_move)
+        if board.is_legal(player, *move):
+            done.add(hash_move)
+            yield move
+
+    captures = sorted(board.captures(player), key=lambda m: push_score(board, m),
+                      reverse=True)
+    for move in captures:
+        code = encode_move(*move)
+        if code not in done:
+            done.add(code)
+            yield move
+
+    for code in list(killers.get(ply, ())):
+        if code not in done and board.is_legal(player, *decode_move(code)):
+            done.add(code)
+            yield decode_move(code)
+
+    quiet = [code for code in legal_moves(board, player) if code not in done]
+    if rotation and quiet:
+        split = rotation % len(quiet)
+        quiet = quiet[split:] + quiet[:split]
+    quiet.sort(key=lambda code: (history.get(code, 0), code >> 6 & 3), reverse=True)
+    for code in quiet:
+        yield decode_move(code)
@@ -0,0 +1,166 @@
+'''
+Lazy SMP: several processes run the same iterative deepening search and share
+one transposition table in shared memory, so what each worker finds prunes
+the search of the others.
+'''
+import queue
+import struct
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+from abalone import config
+from abalone.grid import AbaloneGrid, encode_move, decode_move
+from . import TT
+from . import ordering
+
+TABLE_SIZE = 2**20
+# Seconds between checks that workers which have not reported are still alive
+POLL_INTERVAL = 0.5
+# Quiet moves of each worker are rotated by its index times this
+ROTATION = 7
+MASK64 = 2**64 - 1
+
+# Packed entry: checked key, value, move, depth, flag
+ENTRY = struct.Struct('<QdihB')
+FLAGS = [None, 'exact', 'lower', 'upper']
+
+################################# SHARED TABLE #################################
+class SharedTable(object):
+    '''
+    Fixed-size transposition table of packed entries in shared memory. It
+    takes no locks: every entry stores its key XORed with a checksum of its
+    data, so an entry torn by concurrent writes reads as a miss.
+    '''
+    def __init__(self, size=TABLE_SIZE, name=None):
+        self.size = size
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=size * ENTRY.size)
+            self.memory.buf[:size * ENTRY.size] = bytes(size * ENTRY.size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+
+    def _read(self, key):
+        key &= MASK64
+        checked, value, move, depth, flag = ENTRY.unpack_from(self.memory.buf, (key % self.size) * ENTRY.size)
+        if checked ^ checksum(value, move, depth, flag) != key or not flag:
+            return None
+        return {'move': move, 'value': value,
+                'flag': FLAGS[flag - 1], 'depth': depth}
+
+    def get(self, key, default=None):
+        entry = self._read(key)
+        return default if entry is None else entry
+
+    def __contains__(self, key):
+        return self._read(key) is not None
+
+    def __getitem__(self, key):
+        entry = self._read(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry
+
+    def __setitem__(self, key, entry):
+        key &= MASK64
+        offset = (key % self.size) * ENTRY.size
+        stored = self._read(key)
+        # keep a deeper result for the same position
+        if stored is not None and stored['depth'] > entry['depth']:
+            return
+        move = -1 if entry['move'] is None else entry['move']
+        depth, flag = entry['depth'], FLAGS.index(entry['flag']) + 1
+        value = entry['value']
+        ENTRY.pack_into(self.memory.buf, offset, key ^ checksum(value, move, depth, flag),
+                        value, move, depth, flag)
+
+    def items(self):
+        for index in range(self.size):
+            checked, value, move, depth, flag = ENTRY.unpack_from(self.memory.buf, index * ENTRY.size)
+            if flag:
+                yield checked ^ checksum(value, move, depth, flag), {
+                    'move': move, 'value': value, 'flag': FLAGS[flag - 1], 'depth': depth}
+
+    def close(self):
+        self.memory.close()
+
+    def unlink(self):
+        self.memory.unlink()
+
+def checksum(value, move, depth, flag):
+    bits, = struct.unpack('<Q', struct.pack('<d', value))
+    return (bits ^ ((move & 0xFFFFFFFF) << 24) ^ ((depth & 0xFFFF) << 8) ^ flag) & MASK64
+
+################################### LAZY SMP ###################################
+def worker(index, name, size, keys, variant, state, maximizer, depth, results):
+    '''
+    Search in a worker process on the shared table and report the result,
+    or the error which stopped the search. Workers order quiet moves
+    differently, so that those searching the same depth split the tree.
+    '''
+    TT.zobrist, TT.zobrist_side = keys
+    TT.table = SharedTable(size, name)
+    ordering.rotation = index * ROTATION
+    try:
+        score, move = TT.search(AbaloneGrid(state, variant), maximizer, depth)
+        results.put((depth, score, -1 if move == -1 else encode_move(*move), TT.node_count))
+    except Exception as error:
+        results.put((None, repr(error), -1, TT.node_count))
+    finally:
+        TT.table.close()
+
+def search(board, maximizer, depth, workers=None, size=TABLE_SIZE):
+    '''
+    Run iterative deepening TT.search in several processes at once, every
+    other helper one ply deeper. Returns the result of the deepest search
+    finished by the time the main worker, at the requested depth, is done,
+    or by the time every worker is done or gone.
+    '''
+    workers = workers or mp.cpu_count()
+    if not TT.zobrist_side:
+        TT.initialize_keys()
+    table = SharedTable(size)
+    results = mp.Queue()
+    keys = (TT.zobrist, TT.zobrist_side)
+    state = board.deep_copy(True)
+    variant = board.variant or config.Variant('custom', board.game_over)
+
+    processes = [mp.Process(target=worker, daemon=True,
+                            args=(i, table.name, size, keys, variant, state,
+                                  maximizer, depth + i % 2, results))
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+
+    try:
+        best = None
+        errors = []
+        finished = 0
+        while finished < workers:
+            try:
+                result = results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                # workers killed before reporting never will
+                if all(process.exitcode is not None for process in processes) and results.empty():
+                    break
+                continue
+            finished += 1
+            TT.node_count += result[3]
+            if result[0] is None:
+                errors.append(result[1])
+                continue
+            if best is None or result[0] > best[0]:
+                best = result
+            if result[0] == depth:
+                break
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+        table.close()
+        table.unlink()
+
+    if best is None:
+        raise RuntimeError("Every SMP worker failed: %s" % (', '.join(errors) or 'killed'))
+    _, score, move, _ = best
+    return score, -1 if move == -1 else decode_move(move)
@@ -0,0 +1,380 @@
+'''
+Endgame tablebases
+
+A tablebase holds the exact result of every position of one material class,
+some amount of white and black marbles on the grid, with either player to
+move: won or lost for the player to move and in how many plies, or drawn.
+Captures leave the class, either ending the game or landing in a smaller
+class, so a class is generated once the classes it captures into are.
+
+Generation is a retrograde analysis by passes over the packed results, with
+no other state per position: pass d marks the positions won in d plies,
+those with a move to a position lost in d - 1 plies or winning in d plies
+through a capture, and the positions lost in d plies, those whose every move
+leads to a position won by the opponent in less than d plies. Positions
+still unresolved when no pass can mark any more are drawn. Moves are those
+of the move generator, so results agree with search.
+
+Positions are numbered by a perfect index, the ranks of the white and black
+cells in the combinatorial number system, and results are packed in two
+bytes each in a file read through a memory map:
+
+    HEADER, result of position 0, result of position 1, ...
+
+Every pass generates the moves of every unresolved position, so classes are
+limited to MAX_POSITIONS. That rules out the variants of the game: the mini
+variant ends at two marbles, and its smallest class, three against three, has
+2.2 billion positions. Tables serve games which end at fewer marbles, such as
+
+    python -m abalone.ai.tablebase --game-over 0 --white 2 --black 1
+
+Probing is therefore experimental and off by default: enable() loads tables
+and turns on the probes of the searchers, which load() alone leaves off.
+'''
+import os
+import sys
+import math
+import mmap
+import struct
+import argparse
+from array import array
+from itertools import combinations
+
+from abalone import config
+from abalone.grid import GEOMETRY, decode_move
+from .cache import legal_moves
+
+DIRECTORY = os.environ.get(
+    'ABALONE_TABLEBASES', os.path.join(os.path.dirname(__file__), 'tablebases'))
+
+MAGIC = b'ABTB'
+VERSION = 1
+HEADER = struct.Struct('<4sBBBBB3x')    # magic, version, radius, game over, white, black
+RESULT = struct.Struct('<H')
+SWAP = sys.byteorder == 'big'           # results are stored little-endian
+
+# Results: distance in plies << 2 | outcome for the player to move
+DRAW = 0
+WIN = 1
+LOSS = 2
+
+CELLS = len(GEOMETRY.cells)
+BINOMIAL = [[math.comb(n, k) for k in range(CELLS + 1)] for n in range(CELLS + 1)]
+
+# Largest class generate() takes on, both players to move: results take two
+# bytes per position, and every pass generates the moves of every position
+# left unresolved
+MAX_POSITIONS = 1 << 26
+
+# Loaded tables, by (white marbles, black marbles, game over)
+tables = {}
+# Experimental: whether TT and MCTS probe the loaded tables
+PROBE = False
+
+################################### INDEXING ###################################
+def bits(mask):
+    '''
+    Indices of the set bits of a mask, in increasing order
+    '''
+    indices = []
+    while mask:
+        low = mask & -mask
+        indices.append(low.bit_length() - 1)
+        mask ^= low
+    return indices
+
+def rank(cells):
+    '''
+    Rank of a set of cell indices, increasing, among the sets of their size
+    '''
+    return sum(BINOMIAL[cell][i + 1] for i, cell in enumerate(cells))
+
+def size(white, black):
+    '''
+    Positions of a class with one player to move
+    '''
+    return BINOMIAL[CELLS][white] * BINOMIAL[CELLS - white][black]
+
+def index(key, player):
+    '''
+    Perfect index of a position of its class: black cells are ranked among
+    the cells white leaves free
+    '''
+    white_mask, black_mask = key
+    white = bits(white_mask)
+    black = [cell - bin(white_mask & ((1 << cell) - 1)).count('1') for cell in bits(black_mask)]
+    return ((rank(white) * BINOMIAL[CELLS - len(white)][len(black)] + rank(black)) << 1) | player
+
+def positions(white, black):
+    '''
+    Iterator over the keys of the positions of a class, in no particular order
+    '''
+    for white_cells in combinations(range(CELLS), white):
+        white_mask = sum(1 << cell for cell in white_cells)
+        free = [cell for cell in range(CELLS) if not white_mask >> cell & 1]
+        for black_cells in combinations(free, black):
+            yield white_mask, sum(1 << cell for cell in black_cells)
+
+#################################### TABLES ####################################
+class Table(object):
+    '''
+    Read-only access to the results of a tablebase file through a memory map
+    '''
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty
+            self.file.close()
+            raise ValueError("Not a tablebase file: %s" % path)
+        if len(self.data) < HEADER.size:
+            self.close()
+            raise ValueError("Not a tablebase file: %s" % path)
+        magic, version, radius, self.game_over, self.white, self.black = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION or radius != config.GRID_RADIUS:
+            self.close()
+            if radius != config.GRID_RADIUS:
+                raise ValueError("Tablebase of a grid of radius %d, not %d" % (radius, config.GRID_RADIUS))
+            raise ValueError("Not a tablebase file of version %d: %s" % (VERSION, path))
+        if len(self) != 2 * size(self.white, self.black):
+            self.close()
+            raise ValueError("Truncated tablebase file: %s" % path)
+
+    def __len__(self):
+        return (len(self.data) - HEADER.size) // RESULT.size
+
+    def __getitem__(self, index):
+        return RESULT.unpack_from(self.data, HEADER.size + index * RESULT.size)[0]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+def path(white, black, game_over, directory=None):
+    return os.path.join(directory or DIRECTORY, 'r%d-g%d-%dv%d.tb' % (
+        config.GRID_RADIUS, game_over, white, black))
+
+def load(directory=None):
+    '''
+    Load every tablebase of the directory for the grid radius in use, skipping
+    damaged tables and tables of other format versions, returning how many are
+    loaded
+    '''
+    directory = directory or DIRECTORY
+    if not os.path.isdir(directory):
+        return 0
+    prefix = 'r%d-' % config.GRID_RADIUS
+    for name in sorted(os.listdir(directory)):
+        if name.startswith(prefix) and name.endswith('.tb'):
+            try:
+                table = Table(os.path.join(directory, name))
+            except ValueError:
+                # damaged, or of another grid or format version
+                continue
+            tables[table.white, table.black, table.game_over] = table
+    return len(tables)
+
+def enable(directory=None):
+    '''
+    Load the tablebases of a directory and probe them during searches,
+    returning how many are loaded
+    '''
+    global PROBE
+    PROBE = load(directory) > 0
+    return len(tables)
+
+def unload():
+    global PROBE
+    PROBE = False
+    for table in tables.values():
+        table.close()
+    tables.clear()
+
+def write(results, white, black, game_over, directory=None):
+    target = path(white, black, game_over, directory)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if SWAP:
+        results = array('H', results)
+        results.byteswap()
+    with open(target, 'wb') as tablebase:
+        tablebase.write(HEADER.pack(MAGIC, VERSION, config.GRID_RADIUS, game_over, white, black))
+        tablebase.write(results.tobytes())
+    return target
+
+##################################### PROBING ###################################
+def lookup(key, player, game_over):
+    '''
+    Result of a position with some player to move, or None when no loaded
+    table holds it
+    '''
+    white, black = bin(key[0]).count('1'), bin(key[1]).count('1')
+    table = tables.get((white, black, game_over))
+    if table is None:
+        return None
+    return table[index(key, player)]
+
+def probe(board, player):
+    '''
+    Outcome for the player to move and distance in plies of a position, or
+    None when no loaded table holds it
+    '''
+    result = lookup(board.key, player, board.game_over)
+    if result is None:
+        return None
+    return result & 3, result >> 2
+
+def score(board, player):
+    '''
+    Negamax score of a position for the player to move, as TT.pvs scores
+    won and lost games, or None when no loaded table holds it
+    '''
+    result = probe(board, player)
+    if result is None:
+        return None
+    return (0.0, math.inf, -math.inf)[result[0]]
+
+def best_move(board, player):
+    '''
+    Score and move of a position held by a table: the quickest win, the
+    slowest loss or a drawing move. None when no loaded table holds it.
+    '''
+    result = probe(board, player)
+    if result is None:
+        return None
+    outcome = result[0]
+    best, move = None, -1
+    for code in legal_moves(board, player):
+        successor = decode_move(code)
+        child = board.simulate(*successor, trusted=True)
+        if child.query.check_win(player):
+            value = (WIN, 1)
+        else:
+            found = probe(child, not player)
+            if found is None:
+                continue
+            # the opponent's result, one ply further
+            value = ((DRAW, LOSS, WIN)[found[0]], found[1] + 1)
+        if value[0] != outcome:
+            continue
+        distance = value[1] if outcome == WIN else -value[1]
+        if best is None or distance < best:
+            best, move = distance, successor
+    if move == -1:
+        return None
+    return (0.0, math.inf, -math.inf)[outcome], move
+
+################################## GENERATION ##################################
+def generate(white, black, game_over, variant=None):
+    '''
+    Results of the positions of a class, indexed by position. Positions
+    captured into smaller classes must be in loaded tables.
+    '''
+    from abalone import records
+
+    count = 2 * size(white, black)
+    if count > MAX_POSITIONS:
+        raise ValueError("A class of %d positions is beyond this generator (MAX_POSITIONS is %d)"
+                         % (count, MAX_POSITIONS))
+    variant = variant or config.Variant('custom', game_over)
+    # zero while unresolved: results of win or loss are never zero
+    results = array('H', bytes(RESULT.size * count))
+    horizon = 0
+    d = 0
+    while True:
+        resolved = []
+        for key in positions(white, black):
+            board = None
+            for player in (config.BLACK, config.WHITE):
+                position = index(key, player)
+                if results[position]:
+                    continue
+                if board is None:
+                    board = records.board(key, variant)
+                result, farthest = resolve(board, key, player, white + black, game_over, results, d)
+                horizon = max(horizon, farthest)
+                if result is not None:
+                    resolved.append((position, result))
+        # results of this pass only count from the next one
+        for position, result in resolved:
+            results[position] = result
+        if not resolved and d > horizon:
+            return results
+        d += 1
+
+def resolve(board, key, player, marbles, game_over, results, d):
+    '''
+    Result of a position in pass d, or None while it is unknown, and the
+    farthest distance of the captures leaving its class. It is won in d plies
+    if a move leads to a loss in d - 1 plies or wins in d plies by capture,
+    and lost in d plies if every move leads to a win in less than d plies.
+    '''
+    win = loss = False
+    farthest = 0
+    for move in board.moves(player, encoded=True):
+        child = board.simulate(move, trusted=True)
+        if child.query.check_win(player):
+            outcome, distance = LOSS, 0
+        else:
+            child_key = child.key
+            if bin(child_key[0]).count('1') + bin(child_key[1]).count('1') == marbles:
+                found = results[index(child_key, not player)]
+            else:
+                found = lookup(child_key, not player, game_over)
+                if found is None:
+                    raise ValueError("Generate the tables of the smaller classes first")
+                farthest = max(farthest, (found >> 2) + 1)
+            if not found:
+                # not resolved yet, or drawn
+                loss = True
+                continue
+            outcome, distance = found & 3, found >> 2
+        if outcome == LOSS:
+            if distance == d - 1:
+                win = True
+                break
+        elif outcome != WIN or distance >= d:
+            loss = True
+    if win:
+        return d << 2 | WIN, farthest
+    if not loss:
+        return d << 2 | LOSS, farthest
+    return None, farthest
+
+def build(white, black, game_over, directory=None):
+    '''
+    Generate and write the tables of a class and of every smaller class it
+    captures into, smallest first, loading each as it is written
+    '''
+    if min(white, black) <= game_over:
+        raise ValueError("No class of %dv%d: a game ending at %d marbles is already over"
+                         % (white, black, game_over))
+    written = []
+    for w in range(game_over + 1, white + 1):
+        for b in range(game_over + 1, black + 1):
+            if (w, b, game_over) in tables:
+                continue
+            target = write(generate(w, b, game_over), w, b, game_over, directory)
+            tables[w, b, game_over] = Table(target)
+            written.append(target)
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate endgame tablebases.')
+    parser.add_argument('--game-over', type=int, default=0,
+                        help="marbles at which a player loses")
+    parser.add_argument('--white', type=int, default=2)
+    parser.add_argument('--black', type=int, default=1)
+    parser.add_argument('--directory', default=None)
+    args = parser.parse_args(argv)
+
+    load(args.directory)
+    try:
+        written = build(args.white, args.black, args.game_over, args.directory)
+    except ValueError as error:
+        parser.error(str(error))
+    for target in written:
+        print(target)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
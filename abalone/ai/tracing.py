@@ -0,0 +1,159 @@
+'''
+Search tree tracing
+
+When enabled, the searchers record one event per interior node they finish
+into a ring buffer preallocated at a fixed size, so that the latest events
+survive however long the search. Nodes deeper than MAX_PLY are skipped and
+only one in SAMPLE of the others is kept. When disabled, a search pays a
+single flag test per node.
+
+Traces are exported to a compact binary file and summarised with
+`python -m abalone.ai.tracing trace.bin`: branching factor, first-move
+cutoff rate and transposition table outcomes per ply.
+'''
+import sys
+import struct
+import argparse
+from collections import namedtuple, defaultdict
+
+# Searchers
+TT_PVS = 0
+AI_ALPHABETA = 1
+SEARCHERS = ('TT.pvs', 'AI.alphabeta')
+
+# Transposition table outcomes
+TT_NONE = 0     # the searcher has no table
+TT_MISS = 1     # no entry for the position
+TT_HIT = 2      # an entry, too shallow or out of the window: its move was tried first
+TT_CUTOFF = 3   # an entry which answered the node without searching it
+OUTCOMES = ('none', 'miss', 'hit', 'cutoff')
+
+MAGIC = b'ABTR'
+HEADER = struct.Struct('<4sII')         # magic, events, dropped events
+# searcher, ply, depth, TT outcome, move, cutoff index, children, alpha, beta, score
+EVENT = struct.Struct('<BBbBhhHfff')
+Event = namedtuple('Event', 'searcher ply depth tt move cutoff children alpha beta score')
+
+CAPACITY = 1 << 16
+SAMPLE = 1
+MAX_PLY = 64
+
+enabled = False
+buffer = bytearray()
+capacity = 0
+# Events recorded since the buffer was cleared, and nodes seen for sampling
+recorded = 0
+seen = 0
+
+def enable(size=CAPACITY, sample=SAMPLE, max_ply=MAX_PLY):
+    '''
+    Start tracing into a new ring buffer of some amount of events
+    '''
+    global enabled, buffer, capacity, SAMPLE, MAX_PLY
+    buffer = bytearray(size * EVENT.size)
+    capacity = size
+    SAMPLE, MAX_PLY = sample, max_ply
+    clear()
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def clear():
+    global recorded, seen
+    recorded = seen = 0
+
+def record(searcher, ply, depth, tt, move, cutoff, children, alpha, beta, score):
+    '''
+    Record the event of a finished node, if it is sampled. Moves are encoded,
+    or -1 for none, and the cutoff index is -1 when the node did not cut off.
+    '''
+    global recorded, seen
+    if ply > MAX_PLY:
+        return
+    seen += 1
+    if seen % SAMPLE:
+        return
+    EVENT.pack_into(buffer, (recorded % capacity) * EVENT.size, searcher, min(ply, 255),
+                    max(-128, min(depth, 127)), tt, move, cutoff, min(children, 65535),
+                    alpha, beta, score)
+    recorded += 1
+
+def events():
+    '''
+    The events in the buffer, oldest first
+    '''
+    count = min(recorded, capacity)
+    first = recorded - count
+    for index in range(first, recorded):
+        yield Event(*EVENT.unpack_from(buffer, (index % capacity) * EVENT.size))
+
+def export(path):
+    '''
+    Write the events in the buffer to a trace file
+    '''
+    count = min(recorded, capacity)
+    with open(path, 'wb') as trace:
+        trace.write(HEADER.pack(MAGIC, count, recorded - count))
+        start = recorded % capacity if recorded > capacity else 0
+        trace.write(buffer[start * EVENT.size:count * EVENT.size])
+        trace.write(buffer[:start * EVENT.size])
+    return count
+
+def load(path):
+    '''
+    The events of a trace file, oldest first
+    '''
+    with open(path, 'rb') as trace:
+        magic, count, dropped = HEADER.unpack(trace.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("Not a trace file")
+        for fields in EVENT.iter_unpack(trace.read(count * EVENT.size)):
+            yield Event(*fields)
+
+################################### SUMMARY ####################################
+def summarise(events):
+    '''
+    Per searcher and ply: nodes, mean branching factor (children searched),
+    cutoff rate, rate of cutoffs on the first move, and TT outcomes
+    '''
+    plies = defaultdict(lambda: {'nodes': 0, 'children': 0, 'cutoffs': 0, 'first': 0,
+                                 'tt': [0] * len(OUTCOMES)})
+    for event in events:
+        ply = plies[SEARCHERS[event.searcher], event.ply]
+        ply['nodes'] += 1
+        ply['tt'][event.tt] += 1
+        if event.tt == TT_CUTOFF:
+            continue
+        ply['children'] += event.children
+        if event.cutoff >= 0:
+            ply['cutoffs'] += 1
+            ply['first'] += event.cutoff == 0
+    summary = []
+    for (searcher, ply), stats in sorted(plies.items()):
+        searched = stats['nodes'] - stats['tt'][TT_CUTOFF]
+        summary.append({
+            'searcher': searcher, 'ply': ply, 'nodes': stats['nodes'],
+            'branching': stats['children'] / searched if searched else 0.0,
+            'cutoff_rate': stats['cutoffs'] / searched if searched else 0.0,
+            'first_move_cutoffs': stats['first'] / stats['cutoffs'] if stats['cutoffs'] else 0.0,
+            'tt': dict(zip(OUTCOMES, stats['tt'])),
+        })
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarise a search trace.')
+    parser.add_argument('trace')
+    args = parser.parse_args(argv)
+
+    print("%-13s %4s %8s %9s %7s %7s %8s %8s %8s" % (
+        'searcher', 'ply', 'nodes', 'branching', 'cutoff', 'first', 'tt miss', 'tt hit', 'tt cut'))
+    for row in summarise(load(args.trace)):
+        print("%-13s %4d %8d %9.2f %6.1f%% %6.1f%% %8d %8d %8d" % (
+            row['searcher'], row['ply'], row['nodes'], row['branching'],
+            100 * row['cutoff_rate'], 100 * row['first_move_cutoffs'],
+            row['tt']['miss'], row['tt']['hit'], row['tt']['cutoff']))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
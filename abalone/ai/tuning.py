@@ -0,0 +1,179 @@
+'''
+Texel-style tuning of the evaluation weights over self-play positions
+
+Plays self-play games, extracts the evaluation features of every position into
+NumPy arrays and fits the heuristic weights so that a logistic of the score
+predicts the outcome of the game. The thresholds gating the cohesion and
+marbles terms are picked by grid search. The result is written to the weights
+file loaded by every heuristic:
+
+    python -m abalone.ai.tuning --games 200 --variant mini
+'''
+import argparse
+import itertools as it
+import random
+
+import numpy as np
+
+from abalone import config
+from abalone.grid import AbaloneGrid
+from . import weights
+
+COHESION_THRESHOLDS = np.linspace(0.0, 3.0, 13)
+MARBLES_THRESHOLDS = np.linspace(0.5, 3.0, 11)
+SCALES = np.logspace(-3, 1, 41)
+
+
+def evaluate(features, w):
+    '''
+    Returns the heuristic score of some raw features under some weights.
+    '''
+    center_proximity, cohesion, marbles = features
+    score = w['center'] * center_proximity
+    if abs(center_proximity) > w['cohesion_threshold']:
+        score += w['cohesion'] * cohesion
+    if abs(center_proximity) < w['marbles_threshold']:
+        score += w['marbles'] * marbles
+    return score
+
+
+def selfplay(games, variant='mini', plies=200, epsilon=0.3, rng=None, w=None):
+    '''
+    Plays epsilon-greedy games with one ply of lookahead and yields the
+    features of every position along with the result of its game from White's
+    point of view: 1 for a win, 0 for a loss and 0.5 for an unfinished game
+    with even marbles.
+    '''
+    rng = rng or random.Random()
+    w = w or weights.load('TT')
+    initial_position = config.initial_position(variant)
+    variant = config.variant(variant)
+
+    for _ in range(games):
+        grid = AbaloneGrid(initial_position, variant, rng)
+        player = config.BLACK
+        positions = []
+        result = None
+
+        for _ in range(plies):
+            positions.append(weights.features(grid))
+            moves = list(grid.moves(player))
+            if rng.random() < epsilon:
+                move = rng.choice(moves)
+            else:
+                sign = 1 if player == config.WHITE else -1
+                move = max(moves, key=lambda m: sign * evaluate(
+                    weights.features(grid.simulate(*m, trusted=True)), w))
+            grid.apply(*move)
+            if grid.query.check_win(player):
+                result = 1.0 if player == config.WHITE else 0.0
+                break
+            player = not player
+
+        if result is None:
+            balance = grid.query.marbles(True, True) - grid.query.marbles(False, True)
+            result = 0.5 + 0.5 * np.sign(balance)
+
+        for features in positions:
+            yield features, result
+
+
+def extract(samples):
+    '''
+    Returns the feature matrix and the results vector of some samples.
+    '''
+    samples = list(samples)
+    X = np.array([features for features, _ in samples], dtype=np.float64)
+    y = np.array([result for _, result in samples], dtype=np.float64)
+    return X, y
+
+
+def gate(X, cohesion_threshold, marbles_threshold):
+    '''
+    Returns the features with the cohesion and marbles terms zeroed wherever
+    the heuristic would leave them out.
+    '''
+    center_proximity = np.abs(X[:, 0])
+    return np.column_stack((
+        X[:, 0],
+        X[:, 1] * (center_proximity > cohesion_threshold),
+        X[:, 2] * (center_proximity < marbles_threshold),
+    ))
+
+
+def loss(F, y, coefficients, k):
+    '''
+    Returns the mean squared error between the results and the win
+    probability predicted by the scores.
+    '''
+    p = 1 / (1 + np.exp(-k * F.dot(coefficients)))
+    return np.mean((y - p) ** 2)
+
+
+def fit(F, y, coefficients, k, iterations=500, rate=1.0):
+    '''
+    Minimises the Texel loss by gradient descent over the linear weights.
+    '''
+    scale = np.maximum(np.abs(F).max(axis=0), 1e-9)
+    Fs = F / scale
+    c = coefficients * scale
+    for _ in range(iterations):
+        p = 1 / (1 + np.exp(-k * Fs.dot(c)))
+        gradient = (-2 * k * (y - p) * p * (1 - p)).dot(Fs) / len(y)
+        c -= rate * gradient / k ** 2
+    return c / scale
+
+
+def tune(X, y, initial):
+    '''
+    Returns the tuned weights: the logistic scale is fitted to the initial
+    weights first, then the weights are fitted for every pair of thresholds
+    and the pair with the lowest loss is kept.
+    '''
+    coefficients = np.array([initial['center'], initial['cohesion'], initial['marbles']])
+    F = gate(X, initial['cohesion_threshold'], initial['marbles_threshold'])
+    k = min(SCALES, key=lambda k: loss(F, y, coefficients, k))
+
+    best = None
+    for cohesion_threshold, marbles_threshold in it.product(COHESION_THRESHOLDS,
+                                                            MARBLES_THRESHOLDS):
+        F = gate(X, cohesion_threshold, marbles_threshold)
+        c = fit(F, y, coefficients.copy(), k)
+        error = loss(F, y, c, k)
+        if best is None or error < best[0]:
+            best = (error, c, cohesion_threshold, marbles_threshold)
+
+    error, c, cohesion_threshold, marbles_threshold = best
+    return {
+        'center': float(c[0]),
+        'cohesion': float(c[1]),
+        'marbles': float(c[2]),
+        'cohesion_threshold': float(cohesion_threshold),
+        'marbles_threshold': float(marbles_threshold),
+    }, error
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tune the evaluation weights.')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--variant', default='mini', choices=sorted(config.INITIAL_POSITIONS))
+    parser.add_argument('--plies', type=int, default=200)
+    parser.add_argument('--epsilon', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', default=weights.WEIGHTS_FILE)
+    args = parser.parse_args(argv)
+
+    initial = weights.load('TT')
+    samples = selfplay(args.games, args.variant, args.plies, args.epsilon,
+                       random.Random(args.seed), initial)
+    X, y = extract(samples)
+    print("Positions: ", len(y))
+
+    tuned, error = tune(X, y, initial)
+    weights.save(tuned, args.output)
+    print("Loss: ", error)
+    print("Weights: ", tuned)
+
+
+if __name__ == '__main__':
+    main()
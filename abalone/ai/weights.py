@@ -0,0 +1,59 @@
+'''
+Evaluation weights shared by the heuristics
+'''
+import os
+import json
+
+WEIGHTS_FILE = os.environ.get(
+    'ABALONE_WEIGHTS', os.path.join(os.path.dirname(__file__), 'weights.json'))
+
+# Hand-tuned values each heuristic falls back to when there is no weights file
+DEFAULTS = {
+    'AI': {
+        'center': 1.0,
+        'cohesion': 1.0,
+        'marbles': 100.0,
+        'cohesion_threshold': 2.0,
+        'marbles_threshold': 1.8,
+    },
+    'TT': {
+        'center': 1.0,
+        'cohesion': 1.0,
+        'marbles': 100.0,
+        'cohesion_threshold': 2.0,
+        'marbles_threshold': 1.5,
+    },
+}
+
+
+def load(name, path=None):
+    '''
+    Returns the weights of some heuristic, overridden by the weights file if
+    there is one.
+    '''
+    weights = dict(DEFAULTS[name])
+    path = path or WEIGHTS_FILE
+    if os.path.exists(path):
+        with open(path) as weights_file:
+            weights.update(json.load(weights_file))
+    return weights
+
+
+def save(weights, path=None):
+    '''
+    Writes the weights file loaded by every heuristic.
+    '''
+    with open(path or WEIGHTS_FILE, 'w') as weights_file:
+        json.dump(weights, weights_file, indent=4, sort_keys=True)
+
+
+def features(board):
+    '''
+    Returns the raw evaluation terms of a position, from White's point of
+    view: center proximity, cohesion and marbles difference.
+    '''
+    query = board.query
+    center_proximity = query.center_proximity(False) - query.center_proximity(True)
+    cohesion = len(query.components(False)) - len(query.components(True))
+    marbles = query.marbles(True, True) - query.marbles(False, True)
+    return center_proximity, cohesion, marbles
@@ -0,0 +1,340 @@
+"""
+Command-line interface of the engine. Every subcommand takes its options as
+flags, never prompts, and only imports the engine it runs:
+
+    abalone bestmove --state position.json --player w --engine tt-pvs --depth 4
+    abalone selfplay --games 10 --white tt-pvs --black random --seed 4106
+    abalone bench --engine tt-pvs --depth 3 --trace search.trace
+    abalone perft --depth 2
+    abalone serve --port 7777 --workers 4
+"""
+import sys
+import json
+import math
+import time
+import random
+import argparse
+
+ENGINES = ('random', 'minimax', 'alphabeta', 'pvs', 'tt-alphabeta', 'tt-pvs',
+           'smp', 'mcts')
+
+
+def parse_state(state):
+    """
+    Returns the position of a JSON state, as written by dump.py.
+    """
+    return {player: [tuple(position) for position in state[key]]
+            for player, key in ((True, 'true'), (False, 'false'))}
+
+
+def load_state(path):
+    """
+    Returns the position stored in a JSON state file, as written by dump.py.
+    """
+    with open(path) as json_file:
+        return parse_state(json.load(json_file))
+
+
+def new_grid(args, rng=None):
+    """
+    Returns the grid to start from: the state file if given, the variant's
+    initial position otherwise. The game draws its random moves from rng.
+    """
+    from abalone import config
+    from abalone.grid import AbaloneGrid
+
+    board = load_state(args.state) if getattr(args, 'state', None) else args.variant
+    return AbaloneGrid(config.initial_position(board), config.variant(board), rng)
+
+
+def parse_player(value):
+    return value.lower() in ('w', 'white', 'true')
+
+
+def search(engine, grid, player, args):
+    """
+    Returns the score, the move and the amount of nodes visited by some
+    engine on some position, importing only that engine. Random choices are
+    drawn from the game's random generator.
+    """
+    if engine == 'random':
+        return None, grid.rng.choice(list(grid.moves(player))), 0
+
+    from abalone.ai import cache
+    if args.eval_cache is not None:
+        cache.EVALUATION_CACHE_SIZE = args.eval_cache
+    if args.move_cache is not None:
+        cache.MOVE_CACHE_SIZE = args.move_cache
+
+    if engine in ('minimax', 'alphabeta', 'pvs'):
+        from abalone.ai import AI
+        AI.node_count = 0
+        if engine == 'minimax':
+            score, move = AI.minimax(grid, args.depth, player)
+        elif engine == 'alphabeta':
+            score, move = AI.alphabeta(grid, args.depth, player, -math.inf, math.inf)
+        else:
+            score, move = AI.pvs(grid, player, -math.inf, math.inf, args.depth)
+        return score, move, AI.node_count
+
+    if engine in ('tt-alphabeta', 'tt-pvs', 'smp'):
+        from abalone.ai import TT
+        TT.node_count = 0
+        TT.TABLE_ENTRIES = args.table_entries
+        if not TT.zobrist_side:
+            TT.initialize_keys()
+        if engine == 'tt-alphabeta':
+            score, move = TT.alphabeta(grid, args.depth, player, -math.inf, math.inf)
+        elif engine == 'tt-pvs':
+            score, move = TT.search(grid, player, args.depth)
+        else:
+            from abalone.ai import smp
+            score, move = smp.search(grid, player, args.depth, args.workers)
+        return score, move, TT.node_count
+
+    if engine == 'mcts':
+        from abalone.ai import mcts
+        mcts.MAX_NODES = args.mcts_nodes
+        return None, mcts.UCT(grid, args.iterations, player), args.iterations
+
+    raise ValueError("Unknown engine: %s" % engine)
+
+
+def format_move(move):
+    block, direction = move
+    return {'block': [list(hex) for hex in block], 'direction': list(direction)}
+
+############################### SUBCOMMANDS ###############################
+
+def start_trace(args):
+    if args.trace:
+        from abalone.ai import tracing
+        tracing.enable()
+
+
+def export_trace(args):
+    if args.trace:
+        from abalone.ai import tracing
+        tracing.disable()
+        print("%d events traced to %s" % (tracing.export(args.trace), args.trace),
+              file=sys.stderr)
+
+
+def load_tablebases(args):
+    if args.experimental_tablebases:
+        from abalone.ai import tablebase
+        tablebase.enable(args.experimental_tablebases)
+
+
+def bestmove(args):
+    grid = new_grid(args, random.Random(args.seed))
+    load_tablebases(args)
+    start_trace(args)
+    start = time.time()
+    score, move, nodes = search(args.engine, grid, args.player, args)
+    result = {'move': None if move == -1 else format_move(move), 'score': score,
+              'nodes': nodes, 'time': time.time() - start}
+    export_trace(args)
+    print(json.dumps(result))
+
+
+def play(args, rng):
+    """
+    Returns an iterator over the games played by the engines, printing a
+    summary line for each of them.
+    """
+    from abalone import config, records
+    if args.memory:
+        from abalone.ai import memory
+
+    for game in range(args.games):
+        grid = new_grid(args, rng)
+        key = grid.key
+        player = args.player
+        winner = None
+        moves = []
+        start = time.time()
+        for ply in range(args.max_plies):
+            engine = args.white if player == config.WHITE else args.black
+            if args.memory:
+                memory.reset_peak()
+            _, move, _ = search(engine, grid, player, args)
+            grid.move(*move)
+            moves.append(move)
+            if args.memory:
+                print(json.dumps({'game': game, 'ply': ply, 'engine': engine,
+                                  'memory': memory.report()}))
+            if grid.query.check_win(player):
+                winner = player
+                break
+            player = not player
+        print(json.dumps({'game': game, 'winner': {True: 'white', False: 'black'}.get(winner),
+                          'plies': len(moves), 'time': time.time() - start}))
+        yield records.record(key, args.player, moves, winner)
+
+
+def selfplay(args):
+    from abalone import config, records
+
+    wins = {config.WHITE: 0, config.BLACK: 0, None: 0}
+    load_tablebases(args)
+
+    def tally(games):
+        for game in games:
+            wins[game.winner] += 1
+            yield game
+
+    games = tally(play(args, random.Random(args.seed)))
+    if args.record:
+        with open(args.record, 'wb') as record_file:
+            records.write_games(record_file, games)
+    else:
+        for _ in games:
+            pass
+    print(json.dumps({'white': wins[config.WHITE], 'black': wins[config.BLACK],
+                      'unfinished': wins[None]}))
+
+
+def forget(engine):
+    """
+    Clears what previous searches left in the tables and caches of an
+    engine, so that the next search starts cold.
+    """
+    if engine == 'random':
+        return
+    from abalone.ai import cache
+    cache.evaluations.clear()
+    cache.move_lists.clear()
+    if engine in ('tt-alphabeta', 'tt-pvs', 'smp'):
+        from abalone.ai import TT, ordering
+        TT.table.clear()
+        ordering.clear()
+
+
+def bench(args):
+    """
+    Times the engine at each depth up to the requested one, every search
+    starting from empty tables and caches.
+    """
+    load_tablebases(args)
+    start_trace(args)
+    for depth in range(1, args.depth + 1):
+        args.depth = depth
+        forget(args.engine)
+        grid = new_grid(args, random.Random(args.seed))
+        start = time.time()
+        _, _, nodes = search(args.engine, grid, args.player, args)
+        elapsed = time.time() - start
+        print(json.dumps({'depth': depth, 'nodes': nodes, 'time': elapsed,
+                          'nps': nodes / elapsed if elapsed else None}))
+    export_trace(args)
+
+
+def perft(grid, player, depth):
+    """
+    Returns the amount of leaves of the legal move tree of some depth.
+    """
+    if depth == 0 or grid.query.check_win(not player):
+        return 1
+    return sum(perft(grid.simulate(*move, trusted=True), not player, depth - 1)
+               for move in grid.moves(player))
+
+
+def perft_command(args):
+    grid = new_grid(args)
+    for depth in range(1, args.depth + 1):
+        start = time.time()
+        leaves = perft(grid, args.player, depth)
+        print(json.dumps({'depth': depth, 'leaves': leaves, 'time': time.time() - start}))
+
+def serve(args):
+    from abalone import server
+    server.main(args.host, args.port, args.unix, args.workers, args.queue, args.deadline)
+
+###########################################################################
+
+def parser():
+    parser = argparse.ArgumentParser(prog='abalone', description=__doc__.strip().split('\n')[0])
+    subcommands = parser.add_subparsers(dest='command')
+    subcommands.required = True
+
+    def position(command):
+        command.add_argument('--variant', default='mini', choices=('mini', 'standard'))
+        command.add_argument('--state', help="JSON state file, as written by dump.py")
+        command.add_argument('--player', type=parse_player, default=True,
+                             help="player to move: w or b (default w)")
+
+    def engine(command, default='tt-pvs'):
+        command.add_argument('--depth', type=int, default=3)
+        command.add_argument('--iterations', type=int, default=100,
+                             help="MCTS iterations")
+        command.add_argument('--workers', type=int, default=None,
+                             help="SMP worker processes")
+        command.add_argument('--seed', type=int, default=None)
+        command.add_argument('--table-entries', type=int, default=None,
+                             help="cap on transposition table entries")
+        command.add_argument('--mcts-nodes', type=int, default=None,
+                             help="cap on MCTS tree nodes")
+        command.add_argument('--eval-cache', type=int, default=None,
+                             help="cap on cached evaluations")
+        command.add_argument('--move-cache', type=int, default=None,
+                             help="cap on cached move lists")
+        command.add_argument('--experimental-tablebases', default=None, metavar='DIR',
+                             help="directory of endgame tablebases to probe (experimental)")
+
+    def trace(command):
+        command.add_argument('--trace', help="file to write a trace of the search to, "
+                             "summarised by python -m abalone.ai.tracing")
+
+    command = subcommands.add_parser('bestmove', help="print the best move of a position")
+    position(command)
+    engine(command)
+    command.add_argument('--engine', default='tt-pvs', choices=ENGINES)
+    trace(command)
+    command.set_defaults(func=bestmove)
+
+    command = subcommands.add_parser('selfplay', help="play engines against each other")
+    position(command)
+    engine(command)
+    command.add_argument('--games', type=int, default=1)
+    command.add_argument('--white', default='tt-pvs', choices=ENGINES)
+    command.add_argument('--black', default='random', choices=ENGINES)
+    command.add_argument('--max-plies', type=int, default=500)
+    command.add_argument('--record', help="binary game file to write the games to")
+    command.add_argument('--memory', action='store_true',
+                         help="report the size of the engine structures after every move")
+    command.set_defaults(func=selfplay)
+
+    command = subcommands.add_parser('bench', help="time an engine at increasing depths")
+    position(command)
+    engine(command)
+    command.add_argument('--engine', default='tt-pvs', choices=ENGINES)
+    trace(command)
+    command.set_defaults(func=bench)
+
+    command = subcommands.add_parser('perft', help="count the leaves of the move tree")
+    position(command)
+    command.add_argument('--depth', type=int, default=2)
+    command.set_defaults(func=perft_command)
+
+    command = subcommands.add_parser('serve', help="host engine sessions over a socket")
+    command.add_argument('--host', default='127.0.0.1')
+    command.add_argument('--port', type=int, default=7777)
+    command.add_argument('--unix', help="Unix socket path, instead of TCP")
+    command.add_argument('--workers', type=int, default=None, help="search processes")
+    command.add_argument('--queue', type=int, default=2,
+                         help="searches running or waiting per process")
+    command.add_argument('--deadline', type=float, default=10.0,
+                         help="seconds given to searches without a deadline")
+    command.set_defaults(func=serve)
+
+    return parser
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
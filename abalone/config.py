@@ -1,3 +1,5 @@
+from collections import namedtuple
+
 GRID_RADIUS = 5
 
 GROUP_LENGTHS = range(1, 4)
@@ -5,16 +7,34 @@ GAME_OVER = 8
 BLACK = False
 WHITE = True
 
+# Rules of a game, carried by its grid so that games of different variants
+# can share a process
+Variant = namedtuple('Variant', 'name game_over')
+
+def variant(board):
+    """
+    Returns the rules of some opening, by name or as an initial position
+    """
+    if board == 'standard':
+        return Variant('standard', 8)
+    return Variant(board if board == 'mini' else 'custom', 2)
+
+def initial_position(board):
+    """
+    Returns the initial position of some opening, by name or as itself
+    """
+    if isinstance(board, str):
+        return INITIAL_POSITIONS[board]
+    return board
+
 def initialize(board):
+    """
+    Sets the module-wide rules used by grids without a variant of their own
+    and returns the initial position of some opening
+    """
     global GAME_OVER
-    if board == 'standard':
-        GAME_OVER = 8
-    elif board == 'mini':
-        GAME_OVER = 2
-    else:
-        GAME_OVER = 2
-        return board
-    return INITIAL_POSITIONS[board]
+    GAME_OVER = variant(board).game_over
+    return initial_position(board)
 
 INITIAL_POSITIONS = {
     'mini': {
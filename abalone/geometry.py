@@ -0,0 +1,148 @@
+"""
+Precomputed geometry of hexagonal grids. Everything the move logic asks about
+the shape of the board (which cells exist, their neighbours, the lines of
+marbles which can move together) is computed once per radius, lazily, and
+cached on disk so that later runs start up without rebuilding it.
+
+Cells are plain (x, z) pairs, which compare and hash like the Hexes of the
+grid module.
+"""
+import os
+import pickle
+import itertools as it
+
+VERSION = 2
+CACHE_DIR = os.environ.get(
+    'ABALONE_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'abalone'))
+COMPONENTS_CACHE_SIZE = 2**16
+
+# Same order as Hex.directions
+DIRECTIONS = list(it.permutations((-1, 0, 1), 2))
+
+
+def line_key(line):
+    """
+    Returns the sort key move generation uses for the cells of a line: along
+    the row if they share one, along the z axis otherwise.
+    """
+    if all(cell[1] == line[0][1] for cell in line):
+        return lambda cell: cell[0]
+    return lambda cell: cell[1]
+
+
+class Geometry(object):
+    """
+    Lookup tables of a grid of some radius:
+        - cells: the (x, z) pair of every cell, in the order grids lay them out.
+        - index: the position of every cell in cells, which is also its bit in
+        occupancy masks.
+        - neighbours: for every cell, the index of the neighbour in each
+        direction, or None past the edge.
+        - neighbour_masks: for every cell, the mask of its neighbours.
+        - lines: every straight line of 2 and 3 cells, in both orientations,
+        mapped to the directions of alignment it yields.
+        - aligned_lines: every line sorted the way move generation sorts
+        blocks.
+        - sorted_lines: every line sorted by each of the axes a direction can
+        pick, indexed by the first coordinate of the direction plus one.
+    """
+
+    def __init__(self, radius):
+        self.radius = radius
+        self.cells = tuple((x, z) for x in range(-radius + 1, radius)
+                           for z in range(max(-radius - x, -radius) + 1,
+                                          min(radius - x, radius)))
+        self.index = {cell: index for index, cell in enumerate(self.cells)}
+
+        self.neighbours = tuple(
+            tuple(self.index.get((x + dx, z + dz)) for dx, dz in DIRECTIONS)
+            for x, z in self.cells)
+        self.neighbour_masks = tuple(
+            sum(1 << n for n in neighbours if n is not None)
+            for neighbours in self.neighbours)
+
+        self.lines = {}
+        self.aligned_lines = {}
+        self.sorted_lines = {}
+        for (dx, dz), (x, z), length in it.product(DIRECTIONS, self.cells, (2, 3)):
+            line = tuple((x + k*dx, z + k*dz) for k in range(length))
+            if all(cell in self.index for cell in line):
+                self.lines[line] = ((dx, dz), (-dx, -dz)) * (length - 1)
+                self.aligned_lines[line] = tuple(sorted(line, key=line_key(line)))
+                self.sorted_lines[line] = tuple(
+                    tuple(sorted(line, key=lambda cell: cell[axis])) for axis in (-1, 0, 1))
+
+        self._components = {}
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_components'] = {}
+        return state
+
+    def components(self, mask):
+        """
+        Returns the interconnected groups of an occupancy mask as a tuple of
+        masks. Each group is flooded a whole frontier at a time and the result
+        is cached per mask.
+        """
+        try:
+            return self._components[mask]
+        except KeyError:
+            pass
+
+        neighbour_masks = self.neighbour_masks
+        groups = []
+        unchecked = mask
+        while unchecked:
+            group = frontier = unchecked & -unchecked
+            while frontier:
+                grown = 0
+                while frontier:
+                    low = frontier & -frontier
+                    grown |= neighbour_masks[low.bit_length() - 1]
+                    frontier ^= low
+                frontier = grown & unchecked & ~group
+                group |= frontier
+            groups.append(group)
+            unchecked &= ~group
+
+        if len(self._components) >= COMPONENTS_CACHE_SIZE:
+            self._components.clear()
+        groups = self._components[mask] = tuple(groups)
+        return groups
+
+
+_geometries = {}
+
+
+def cache_path(radius):
+    return os.path.join(CACHE_DIR, 'geometry-r%d-v%d.pickle' % (radius, VERSION))
+
+
+def for_radius(radius):
+    """
+    Returns the Geometry of some radius, loading it from the disk cache or
+    building and caching it the first time it is asked for.
+    """
+    try:
+        return _geometries[radius]
+    except KeyError:
+        pass
+
+    path = cache_path(radius)
+    try:
+        with open(path, 'rb') as cache:
+            result = pickle.load(cache)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+        result = Geometry(radius)
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            temporary = '%s.%d' % (path, os.getpid())
+            with open(temporary, 'wb') as cache:
+                pickle.dump(result, cache, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, path)
+        except OSError:
+            pass
+
+    _geometries[radius] = result
+    return result
@@ -8,9 +8,11 @@ import itertools as it
 from numbers import Number
 from operator import itemgetter
 from functools import wraps
-from collections import namedtuple
+from collections import namedtuple, ChainMap
+from collections.abc import Mapping
 
 from . import config
+from . import geometry
 from .utils import split_when
 
 class IllegalMove(Exception):
@@ -21,43 +23,72 @@ HexBase = namedtuple('Hex', ('x', 'z'))
 class Hex(HexBase):
     """
     Representation of a hex or tile on the grid.
+
+    The hexes of the board and of the ring around it are interned: creating
+    one of them always returns the same object, which carries precomputed
+    lookup tables for its arithmetic. Any other Hex is computed as usual.
     """
 
     directions = [(_x, _z) for _x, _z in  # Collide with attrs
                   it.permutations((-1, 0, 1), 2)]
 
+    _interned = {}
+
+    def __new__(cls, x, z):
+        hex = cls._interned.get((x, z))
+        if hex is None:
+            return super(Hex, cls).__new__(cls, x, z)
+        return hex
+
+    def __reduce__(self):
+        return (Hex, (self.x, self.z))
+
     @property
     def y(self):
         return -self.x - self.z
 
     def __add__(self, other):
-        return Hex(*[s + o for s, o in zip(self, other)])
+        try:
+            return self._steps[other]
+        except (AttributeError, KeyError, TypeError):
+            return Hex(*[s + o for s, o in zip(self, other)])
 
     def __rmul__(self, other):
         return self.__mul__(other)
 
     def __mul__(self, other):
         if isinstance(other, Number):
-            return Hex(*[other*axis for axis in self])
+            try:
+                return self._multiples[other]
+            except (AttributeError, KeyError):
+                return Hex(*[other*axis for axis in self])
         return super(Hex, self).__mul__(other)
 
     def __neg__(self):
-        return Hex(*[-axis for axis in self])
+        try:
+            return self._negative
+        except AttributeError:
+            return Hex(*[-axis for axis in self])
 
     def neighbours(self):
         """
         Returns an iterator with all the surrounding Hexes.
         """
-        for x, z in self.directions:
-            yield Hex(x=self.x + x, z=self.z + z)
+        try:
+            return iter(self._neighbours)
+        except AttributeError:
+            return (Hex(x=self.x + x, z=self.z + z) for x, z in self.directions)
 
     def distance(self, hex):
         """
         Returns the moving distance from the specified Hex.
         """
-        return (abs(self.x - hex.x) +
-                abs(self.y - hex.y) +
-                abs(self.z - hex.z)) / 2
+        try:
+            return self._distances[hex._id]
+        except AttributeError:
+            return (abs(self.x - hex.x) +
+                    abs(self.y - hex.y) +
+                    abs(self.z - hex.z)) / 2
 
     def is_adjacent(self, hex):
         """
@@ -69,13 +100,98 @@ class Hex(HexBase):
         """
         Returns the direction from this Hex to the other.
         """
-        return (hex.x - self.x, hex.z - self.z)
+        try:
+            return self._directions[hex]
+        except (AttributeError, KeyError):
+            return (hex.x - self.x, hex.z - self.z)
+
+
+def intern_hexes(radius):
+    """
+    Interns every Hex of a grid of the given radius plus the surrounding ring
+    and fills their lookup tables. Steps reach as far as a three marble push
+    can go, which covers every offset used by the move logic.
+    """
+    cells = [Hex(x=x, z=z) for x in range(-radius, radius + 1)
+             for z in range(-radius, radius + 1) if abs(x + z) <= radius]
+    for hex in cells:
+        Hex._interned[tuple(hex)] = hex
+
+    offsets = {Hex(x=k*x, z=k*z) for x, z in Hex.directions for k in range(4)}
+    for id, hex in enumerate(cells):
+        hex._id = id
+        hex._negative = Hex(x=-hex.x, z=-hex.z)
+        hex._multiples = {k: Hex(x=k*hex.x, z=k*hex.z) for k in range(4)}
+        hex._steps = {offset: Hex(x=hex.x + offset.x, z=hex.z + offset.z)
+                      for offset in offsets}
+        hex._neighbours = tuple(hex._steps[d] for d in Hex.directions)
+        hex._directions = {n: d for n, d in zip(hex._neighbours, Hex.directions)}
+    for hex in cells:
+        hex._distances = [(abs(hex.x - other.x) +
+                           abs(hex.y - other.y) +
+                           abs(hex.z - other.z)) / 2 for other in cells]
+
+
+intern_hexes(config.GRID_RADIUS)
+
+
+def board_cells(radius):
+    """
+    Returns an iterator with all the Hexes of a grid of the given radius, in
+    the same order BaseGrid lays them out.
+    """
+    for x, z in geometry.for_radius(radius).cells:
+        yield Hex(x=x, z=z)
+
+
+# Every on-board Hex gets a bit in the occupancy masks
+GEOMETRY = geometry.for_radius(config.GRID_RADIUS)
+CELLS = tuple(board_cells(config.GRID_RADIUS))
+INDEX = GEOMETRY.index
+
+_cells = {GEOMETRY.radius: CELLS}
+
+
+def geometry_cells(geometry):
+    """
+    Returns the Hexes of a geometry, indexed as its cells.
+    """
+    try:
+        return _cells[geometry.radius]
+    except KeyError:
+        cells = _cells[geometry.radius] = tuple(board_cells(geometry.radius))
+        return cells
+
+
+def mask_hexes(mask, geometry=GEOMETRY):
+    """
+    Returns an iterator with the Hexes whose bits are set in the mask.
+    """
+    cells = geometry_cells(geometry)
+    while mask:
+        low = mask & -mask
+        yield cells[low.bit_length() - 1]
+        mask ^= low
 
 
 class HexBlock(tuple):
     def __new__(cls, *args):
         return super(HexBlock, cls).__new__(cls, *args)
 
+    @classmethod
+    def aligned(cls, hexes):
+        """
+        Returns the HexBlock of some aligned hexes, sorted along the row if
+        they share one and along the z axis otherwise.
+        """
+        hexes = tuple(hexes)
+        aligned = ALIGNED_LINES.get(hexes)
+        if aligned is not None:
+            return aligned
+        if all(hex[1] == hexes[0][1] for hex in hexes):
+            return cls(tuple(sorted(hexes, key=itemgetter(0))))
+        return cls(tuple(sorted(hexes, key=itemgetter(1))))
+
     def is_valid(self):
         """
         Returns wether this HexBlock is valid:
@@ -83,9 +199,11 @@ class HexBlock(tuple):
             - all the hexes must be adjacent to one another.
             - all the hexes must be aligned in the same direction.
         """
+        if len(self) not in config.GROUP_LENGTHS:
+            return False
+        if len(self) == 1 or self in GEOMETRY.lines:
+            return True
         return all((
-            # Must have a valid length
-            len(self) in config.GROUP_LENGTHS,
             # Must be adjacent to one another
             all((a.is_adjacent(b) for a, b in zip(self, self[1:]))),
             # Must be in the same direction
@@ -103,6 +221,9 @@ class HexBlock(tuple):
         if len(self) == 1:
             for direction in Hex.directions:
                 yield direction
+        elif self in GEOMETRY.lines:
+            for direction in GEOMETRY.lines[self]:
+                yield direction
         else:
             transition = zip(self, self[1:])
             for a, b in transition:
@@ -114,6 +235,8 @@ class HexBlock(tuple):
         Returns the strength of push in a given direction: the amount of hexes
         aligned in that direction
         """
+        if len(self) > 1 and self in GEOMETRY.lines:
+            return len(self) if direction in GEOMETRY.lines[self][:2] else 1
         return len(self) if direction in self.directions else 1
 
     def sorted(self, direction):
@@ -121,25 +244,125 @@ class HexBlock(tuple):
         Returns an HexBlock sorted in the specified direction.
         """
         axis = next((pos for axis, pos in enumerate(direction)))
+        if self in SORTED_LINES:
+            return SORTED_LINES[self][axis + 1]
         return HexBlock(sorted(self, key=itemgetter(axis)))
 
 
+def line_block(cells):
+    """
+    Returns the HexBlocks of some lines of cells.
+    """
+    return HexBlock(Hex(*cell) for cell in cells)
+
+
+# Lines of the geometry as ready-made HexBlocks
+ALIGNED_LINES = {line: line_block(aligned)
+                 for line, aligned in GEOMETRY.aligned_lines.items()}
+SORTED_LINES = {line: tuple(line_block(axis) for axis in axes)
+                for line, axes in GEOMETRY.sorted_lines.items()}
+
+
+# Encoded moves both ways, filled in as moves are met
+ENCODED = {}
+DECODED = {}
+
+
+def encode_move(block, direction):
+    """
+    Returns a move as a small integer packing the index of the first hex of
+    the sorted block, the block length, the direction of alignment and the
+    direction of movement. Fits in 14 bits.
+    """
+    try:
+        return ENCODED[block, direction]
+    except KeyError:
+        pass
+    except TypeError:
+        block, direction = tuple(block), tuple(direction)
+        if (block, direction) in ENCODED:
+            return ENCODED[block, direction]
+    aligned = HexBlock.aligned(block)
+    alignment = Hex.directions.index(aligned[0].direction(aligned[1])) if len(aligned) > 1 else 0
+    code = ((INDEX[aligned[0]] << 8) | ((len(aligned) - 1) << 6) |
+            (alignment << 3) | Hex.directions.index(tuple(direction)))
+    ENCODED[block, direction] = code
+    return code
+
+
+def decode_move(code):
+    """
+    Returns the block and direction of an encoded move.
+    """
+    try:
+        return DECODED[code]
+    except KeyError:
+        pass
+    anchor = CELLS[code >> 8]
+    alignment = Hex.directions[(code >> 3) & 7]
+    block = [anchor]
+    for _ in range((code >> 6) & 3):
+        block.append(block[-1] + alignment)
+    move = DECODED[code] = HexBlock.aligned(block), Hex.directions[code & 7]
+    return move
+
+
 def queryset(func):
     """
-    Returns a HexQuerySet object from an iterator of Hexes.
+    Returns a HexQuerySet view over the same grid from an iterator of Hexes.
     """
     @wraps(func)
     def wrapper(self, *args, **kwargs):
-        results = func(self, *args, **kwargs)
-        results = ((hex, self[hex]) for hex in results)
-        return HexQuerySet(results)
+        return HexQuerySet(self.grid, func(self, *args, **kwargs))
     return wrapper
 
 
-class HexQuerySet(dict):
-    def __init__(self, states):
-        for hex, state in states:
-            self[hex] = state
+class HexQuerySet(Mapping):
+    """
+    Read-only view over the hexes of a grid. States are always read from the
+    live grid and filters are lazy: they only run when the view is first
+    looked into, and nothing is copied.
+    """
+
+    def __init__(self, grid, hexes=None):
+        self.grid = grid
+        self._hexes = hexes
+
+    @property
+    def hexes(self):
+        """
+        Returns the hexes this view is restricted to, running the filter the
+        first time it is needed.
+        """
+        if self._hexes is None:
+            return self.grid
+        if not isinstance(self._hexes, dict):
+            self._hexes = dict.fromkeys(self._hexes)
+        return self._hexes
+
+    @property
+    def geometry(self):
+        return getattr(self.grid, 'geometry', GEOMETRY)
+
+    def __getitem__(self, hex):
+        if self._hexes is not None and hex not in self.hexes:
+            raise KeyError(hex)
+        return self.grid[hex]
+
+    def __contains__(self, hex):
+        return hex in self.hexes
+
+    def __iter__(self):
+        return iter(self.hexes)
+
+    def __len__(self):
+        return len(self.hexes)
+
+    def items(self):
+        if self._hexes is None:
+            return self.grid.items()
+        grid = self.grid
+        return ((hex, grid[hex]) for hex in self.hexes)
 
     @queryset
     def neighbours(self, hex):
@@ -180,29 +403,42 @@ class HexQuerySet(dict):
         """
         moves = ((axis*step for axis in direction) for step in range(distance))
         places = (hex + move for move in moves)
-        return set(self.keys()) & set(places)
+        return (place for place in places if place in self)
+
+    def mask(self, state):
+        """
+        Returns the occupancy mask of some player.
+        """
+        if self._hexes is None and isinstance(self.grid, BaseGrid):
+            return self.grid.mask(state)
+        index = self.geometry.index
+        mask = 0
+        for hex, s in self.items():
+            if s == state:
+                mask |= 1 << index[hex]
+        return mask
+
+    def components(self, state):
+        """
+        Returns the masks of the interconnected groups of some player.
+        """
+        return self.geometry.components(self.mask(state))
 
     def populations(self, state):
         """
         Returns sets of interconnected hexes.
         """
-        unchecked = set(self.by_state(state).keys())
-        while unchecked:
-            neighbours = {unchecked.pop()}
-            group = set()
-            while neighbours:
-                hex = neighbours.pop()
-                unchecked.discard(hex)
-                group.add(hex)
-                neighbours.update(set(hex.neighbours()) & unchecked)
-            yield group
+        for group in self.components(state):
+            yield set(mask_hexes(group, self.geometry))
 
     @queryset
     def population(self, hex):
         """
         Returns the set of interconnected hexes where the specified hex lies.
         """
-        return next((pop for pop in self.populations(self[hex]) if hex in pop))
+        bit = 1 << self.geometry.index[hex]
+        return mask_hexes(next((group for group in self.components(self[hex])
+                                if group & bit)), self.geometry)
 
     def are_connected(self):
         """
@@ -212,8 +448,7 @@ class HexQuerySet(dict):
         states = set(self.values())
         if len(states) != 1 or states == {None}:
             return False
-        populations = self.populations(states.pop())
-        return len(list(populations)) == 1
+        return len(self.components(states.pop())) == 1
 
     def hex_blocks(self, hex, lengths=None):
         """
@@ -230,15 +465,9 @@ class HexQuerySet(dict):
 
         for direction, distance in it.product(directions, lengths):
             block = population.by_vector(hex, direction, distance)
-            block = HexBlock(block.keys())
 
             # Sort blocks to ensure adjacency
-            if all(hex[1] == block[0][1] for hex in block):
-                block = HexBlock(tuple(sorted(block, key=itemgetter(0))))
-            else:
-                block = HexBlock(tuple(sorted(block,key=itemgetter(1))))
-
-            blocks.add(block)
+            blocks.add(HexBlock.aligned(block.keys()))
         return blocks
 
     def blocks(self, state, lengths=None):
@@ -248,11 +477,36 @@ class HexQuerySet(dict):
         return {HexBlock(block) for hex in self.by_state(state)
                 for block in self.hex_blocks(hex, lengths)}
 
-    @queryset
+    def pushed(self, block, direction):
+        """
+        Returns the enemy marbles which moving the given block in the given
+        direction would push, which are none for broadside or single moves.
+        """
+        if len(block) < 2 or direction not in block.directions:
+            return []
+        state = self[block[0]]
+        hex = next((hex for hex in block if hex + direction not in block))
+        enemies = []
+        hex = hex + direction
+        while self.get(hex) == (not state):
+            enemies.append(hex)
+            hex = hex + direction
+        return enemies
+
     def move(self, block, direction):
         """
-        Attempts to move the given block in the given direction rising and
-        IllegalMove exception if it is not possible because:
+        Returns a view of how this queryset would look after moving the given
+        block in the given direction. The grid itself is left untouched.
+        """
+        changes = self.changes(block, direction)
+        hexes = None if self._hexes is None else self.hexes
+        return HexQuerySet(ChainMap(changes, self.grid), hexes)
+
+    def changes(self, block, direction):
+        """
+        Returns the hexes that moving the given block in the given direction
+        would overwrite, along with their new states. Rises an IllegalMove
+        exception if the move is not possible because:
             - the specified block isn't correct.
             - the specified direction isn't correct.
             - there is not place enough to move the marbles.
@@ -284,6 +538,7 @@ class HexQuerySet(dict):
             raise IllegalMove("Enemy is stronger.")
 
         new_block = set((hex + Hex(*direction) for hex in block))
+        changes = {}
         
         if direction not in block.directions:
             # Broadside mvoe
@@ -302,36 +557,42 @@ class HexQuerySet(dict):
                 # Sumito move
                 # Clear all the own and enemy marbles
                 for hex in it.chain(block, enemies):
-                    self[hex] = None
+                    changes[hex] = None
 
                 new_enemies = [(hex + direction, not state) for hex in enemies
                             if hex + direction in self]
-                self.update(new_enemies)
+                changes.update(new_enemies)
         
         # Clear all the own marbles
         for hex in block:
-            self[hex] = None
+            changes[hex] = None
         
         new_block = [(hex + direction, state) for hex in block]
         if any((hex not in self for hex, state in new_block)):
             raise IllegalMove("Attempting to move off the grid.")
-        self.update(new_block)
-        return self.keys()
+        changes.update(new_block)
+        return changes
 
     def marbles(self, state, length=False):
         """
         Returns the number of marbles for a given player.
         """
-        marbles = {k: v for k, v in self.items() if v == state}
         if length:
-            return len(marbles)
-        return marbles
+            return bin(self.mask(state)).count('1')
+        return {k: v for k, v in self.items() if v == state}
     
+    @property
+    def game_over(self):
+        grid = self.grid
+        while isinstance(grid, ChainMap):
+            grid = grid.maps[-1]
+        return getattr(grid, 'game_over', config.GAME_OVER)
+
     def check_win(self, state):
         """
         Checks if the game is over (opposing player has lost >= GAME_OVER marbles)
         """
-        if len(self.marbles(not state)) <= config.GAME_OVER:
+        if self.marbles(not state, True) <= self.game_over:
             return True
         return False
     
@@ -343,8 +604,8 @@ class HexQuerySet(dict):
         center = Hex(0,0)
 
         distance = -math.inf
-        marbles = self.marbles(state)
-        for marble in marbles.keys():
+        marbles = list(mask_hexes(self.mask(state), self.geometry))
+        for marble in marbles:
             if distance == -math.inf:
                 distance = marble.distance(center)
             else:
@@ -401,15 +662,56 @@ class BaseGrid(dict):
         None: '.',
     }
 
-    def __init__(self, r):
+    def __init__(self, r, variant=None, rng=None):
         self.radius = r
-        for x in self.axis_range():
-            for z in self.axis_range(x):
-                self[Hex(x=x, z=z)] = None
+        self.geometry = geometry.for_radius(r)
+        # Rules and random generator of the game, shared by its copies
+        self.variant = variant
+        self.rng = rng or random.Random()
+        self._masks = None
+        self.update(dict.fromkeys(board_cells(r)))
+
+    def __setitem__(self, hex, state):
+        self._masks = None
+        super(BaseGrid, self).__setitem__(hex, state)
+
+    def update(self, *args, **kwargs):
+        self._masks = None
+        super(BaseGrid, self).update(*args, **kwargs)
 
     @property
     def query(self):
-        return HexQuerySet(self.items())
+        return HexQuerySet(self)
+
+    @property
+    def game_over(self):
+        """
+        Returns the amount of marbles below which a player loses, from the
+        variant of the game or the module-wide configuration.
+        """
+        if self.variant is None:
+            return config.GAME_OVER
+        return self.variant.game_over
+
+    @property
+    def key(self):
+        """
+        Returns a hashable key which identifies the position on the grid.
+        """
+        return (self.mask(self.WHITE), self.mask(self.BLACK))
+
+    def mask(self, state):
+        """
+        Returns the occupancy mask of some player, computed once per position.
+        """
+        if self._masks is None:
+            index = self.geometry.index
+            masks = {self.WHITE: 0, self.BLACK: 0}
+            for hex, s in self.items():
+                if s is not None:
+                    masks[s] |= 1 << index[hex]
+            self._masks = masks
+        return self._masks[state]
 
     def axis_range(self, v=0):
         """
@@ -434,47 +736,168 @@ class BaseGrid(dict):
         }
         if raw == True:
             return copy
-        return AbaloneGrid(copy)
+        return self.copy()
 
-    def move(self, block, direction):
+    def copy(self):
+        """
+        Returns a new grid with the same position.
+        """
+        grid = self.__class__.__new__(self.__class__)
+        dict.update(grid, self)
+        grid.radius = self.radius
+        grid.geometry = self.geometry
+        grid.variant = self.variant
+        grid.rng = self.rng
+        grid._masks = self._masks
+        return grid
+
+    def move(self, block, direction=None):
         """
         Attempts to move some block in some direction rising an IllegalMove
-        exception if that movement is illegal.
+        exception if that movement is illegal. The block may also be an
+        encoded move (see encode_move), without direction.
         """
-        for block, state in self.query.move(block, direction).items():
-            self[block] = state
+        if direction is None:
+            block, direction = decode_move(block)
+        self.update(self.query.changes(block, direction))
 
-    def moves(self, state, rnd=False, seed=None):
+    def apply(self, block, direction=None):
         """
-        Returns all the possible moves for some player.
+        Moves some block in some direction without checking that the move is
+        legal, writing only the hexes that change and keeping the occupancy
+        masks up to date. Meant for moves coming from the move generator; any
+        other move must go through `move`. The block may also be an encoded
+        move, without direction.
+        """
+        if direction is None:
+            block, direction = decode_move(block)
+        block = block.sorted(direction)
+        state = self[block[0]]
+
+        # Same writes, in the same order, as HexQuerySet.changes
+        changes = [(hex, None) for hex in block]
+        if direction in block.directions:
+            step = Hex(*direction)
+            front = next((hex + step for hex in block if hex + step not in block))
+            enemies = []
+            for hex in (hex + block.strength(direction)*step for hex in block):
+                if self.get(hex) != (not state):
+                    break
+                enemies.append(hex)
+            if front in enemies:
+                # Sumito move
+                changes.extend((hex, None) for hex in enemies)
+                changes.extend((hex + step, not state) for hex in enemies
+                               if hex + step in self)
+                changes.extend((hex, None) for hex in block)
+        changes.extend((hex + direction, state) for hex in block)
+
+        masks = self._masks
+        if masks is not None:
+            # Copies share their masks: never update them in place
+            masks = dict(masks)
+            index = self.geometry.index
+            for hex, new in changes:
+                old = dict.__getitem__(self, hex)
+                if old is not None:
+                    masks[old] &= ~(1 << index[hex])
+                dict.__setitem__(self, hex, new)
+                if new is not None:
+                    masks[new] |= 1 << index[hex]
+            self._masks = masks
+        else:
+            for hex, new in changes:
+                dict.__setitem__(self, hex, new)
+
+    def simulate(self, block, direction=None, trusted=False):
+        """
+        Returns a copy of the grid with some block moved in some direction,
+        leaving this grid untouched. Trusted moves, which come from the move
+        generator, skip validation (see `apply`).
+        """
+        grid = self.copy()
+        if trusted:
+            grid.apply(block, direction)
+        else:
+            grid.move(block, direction)
+        return grid
+
+    def moves(self, state, rnd=False, rng=None, encoded=False):
+        """
+        Returns all the possible moves for some player, as encoded moves if
+        asked to (see encode_move). Random block lengths are drawn from the
+        random generator given, or else from the grid's own.
         """
         lengths = config.GROUP_LENGTHS
         if rnd:
-            lengths = random.randrange(lengths[0], lengths[1])
+            lengths = (rng or self.rng).randrange(lengths[0], lengths[-1] + 1)
             lengths = range(lengths, lengths + 1)
-        if seed:
-            if seed.__class__.__name__ == 'method':
-                random.seed = seed
-            else:
-                random.seed(seed)
         
-        blocks = list(self.query.blocks(state, lengths))
+        query = self.query
+        blocks = list(query.blocks(state, lengths))
         for block in blocks:
             for direction in Hex.directions:
                 try:
-                    self.query.move(block, direction)
+                    query.changes(block, direction)
                 except IllegalMove:
                     pass
                 else:
-                    yield block, direction
+                    yield encode_move(block, direction) if encoded else (block, direction)
+
+    def captures(self, state):
+        """
+        Returns all the possible moves for some player which push enemy
+        marbles.
+        """
+        query = self.query
+        lengths = [length for length in config.GROUP_LENGTHS if length > 1]
+        for front in mask_hexes(self.mask(state), self.geometry):
+            for direction in Hex.directions:
+                # Count the enemies in front of the marble
+                hex = front + direction
+                enemies = 0
+                while self.get(hex) == (not state):
+                    enemies += 1
+                    hex = hex + direction
+                # They must be followed by an empty hex or the edge
+                if not enemies or self.get(hex) is not None:
+                    continue
+
+                back = -Hex(*direction)
+                block = [front]
+                for length in range(2, max(lengths) + 1):
+                    hex = block[-1] + back
+                    if self.get(hex) != state:
+                        break
+                    block.append(hex)
+                    if length in lengths and length > enemies:
+                        # Leave the last word to the move rules
+                        aligned = HexBlock.aligned(block)
+                        try:
+                            query.changes(aligned, direction)
+                        except IllegalMove:
+                            continue
+                        yield aligned, direction
+
+    def is_legal(self, state, block, direction):
+        """
+        Returns wether some player could move some block in some direction.
+        """
+        if any((self.get(hex) != state for hex in block)):
+            return False
+        try:
+            self.query.changes(block, direction)
+        except IllegalMove:
+            return False
+        return True
 
 
 
 
 
 class AbaloneGrid(BaseGrid):
-    def __init__(self, initial_position):
-        super(AbaloneGrid, self).__init__(config.GRID_RADIUS)
+    def __init__(self, initial_position, variant=None, rng=None):
+        super(AbaloneGrid, self).__init__(config.GRID_RADIUS, variant, rng)
         positions = {position: state
                      for state, positions in initial_position.items()
                      for position in positions}
@@ -0,0 +1,323 @@
+"""
+Compact binary format for positions and game records.
+
+A position is the pair of occupancy masks of the grid (see `BaseGrid.key`)
+plus the player to move, 17 bytes in all. A game is its initial position,
+its winner and its moves as 16 bit codes (see `grid.encode_move`).
+
+Every file starts with a header holding a magic string, the kind of records
+it stores, the format version and the grid radius, so that masks are never
+read against the wrong geometry. Games are grouped in blocks of up to
+BLOCK_GAMES games, each with a block header and the offsets of its games:
+
+    position file: HEADER, POSITION, POSITION, ...
+    game file:     HEADER, block, block, ...
+    block:         BLOCK, OFFSET * games, GAME, moves, GAME, moves, ...
+
+Files are written and read as streams by generators, a block at a time, and
+`Positions` and `Games` give random access to them by index through a
+memory map, hopping from block header to block header when opened.
+"""
+import sys
+import mmap
+import struct
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+from abalone import config
+from abalone.grid import AbaloneGrid, GEOMETRY, mask_hexes, encode_move, decode_move
+
+MAGIC = b'ABLN'
+VERSION = 2
+POSITIONS = 0
+GAMES = 1
+
+HEADER = struct.Struct('<4sBBBx')       # magic, kind, version, radius
+POSITION = struct.Struct('<QQB')        # white mask, black mask, player
+GAME = struct.Struct('<QQBBI')          # white mask, black mask, player, winner, moves
+MOVE = struct.Struct('<H')
+BLOCK = struct.Struct('<II')            # games, bytes of the games
+OFFSET = struct.Struct('<I')            # offset of a game from the first one of its block
+BLOCK_GAMES = 4096
+SWAP = sys.byteorder == 'big'            # move arrays are stored little-endian
+
+WINNERS = {config.BLACK: 0, config.WHITE: 1, None: 2}
+WINNERS_BY_CODE = {code: winner for winner, code in WINNERS.items()}
+
+Position = namedtuple('Position', 'key player')
+Game = namedtuple('Game', 'key player winner moves')
+
+
+def position(board, player):
+    """
+    Returns the record of a board with some player to move.
+    """
+    return Position(board.key, player)
+
+
+def board(key, variant=None, rng=None):
+    """
+    Returns a new grid from the occupancy masks of a record.
+    """
+    white, black = key
+    return AbaloneGrid({config.WHITE: list(mask_hexes(white)),
+                        config.BLACK: list(mask_hexes(black))}, variant, rng)
+
+
+def replay(game, variant=None):
+    """
+    Returns an iterator over the positions of a game, from the initial one
+    to the final one, as (board, player to move) pairs.
+    """
+    grid = board(game.key, variant)
+    player = game.player
+    yield grid, player
+    for code in game.moves:
+        grid.move(*decode_move(code))
+        player = not player
+        yield grid, player
+
+
+def record(key, player, moves, winner=None):
+    """
+    Returns the record of a game from its initial position and its moves,
+    encoding the moves which are not already.
+    """
+    return Game(key, player, winner,
+                array('H', (move if isinstance(move, int) else encode_move(*move)
+                            for move in moves)))
+
+################################## FILES ##################################
+
+def _header(kind):
+    return HEADER.pack(MAGIC, kind, VERSION, config.GRID_RADIUS)
+
+
+def _check_header(data, kind):
+    if len(data) < HEADER.size:
+        raise ValueError("Not a %s file" % ('position', 'game')[kind])
+    magic, found, version, radius = HEADER.unpack_from(data)
+    if magic != MAGIC or found != kind:
+        raise ValueError("Not a %s file" % ('position', 'game')[kind])
+    if version != VERSION:
+        raise ValueError("Unsupported record version: %d" % version)
+    if radius != config.GRID_RADIUS:
+        raise ValueError("Records of a grid of radius %d, not %d" % (radius, config.GRID_RADIUS))
+
+
+def _check_radius():
+    if len(GEOMETRY.cells) > 64:
+        raise ValueError("A grid of radius %d does not fit in 64 bit masks" % config.GRID_RADIUS)
+
+
+def write_positions(file, positions):
+    """
+    Writes an iterable of Position records to a binary file object, and
+    returns how many were written.
+    """
+    _check_radius()
+    file.write(_header(POSITIONS))
+    count = 0
+    for (white, black), player in positions:
+        file.write(POSITION.pack(white, black, player))
+        count += 1
+    return count
+
+
+def read_positions(file, chunk=1 << 20):
+    """
+    Returns an iterator over the Position records of a binary file object,
+    reading it in chunks.
+    """
+    _check_header(file.read(HEADER.size), POSITIONS)
+    buffer = b''
+    while True:
+        data = file.read(chunk)
+        if not data:
+            break
+        buffer += data
+        end = len(buffer) - len(buffer) % POSITION.size
+        for white, black, player in POSITION.iter_unpack(buffer[:end]):
+            yield Position((white, black), bool(player))
+        buffer = buffer[end:]
+    if buffer:
+        raise ValueError("Truncated position file")
+
+
+def write_games(file, games):
+    """
+    Writes an iterable of Game records to a binary file object, and returns
+    how many were written.
+    """
+    _check_radius()
+    file.write(_header(GAMES))
+    count = 0
+    block = []
+    for (white, black), player, winner, moves in games:
+        if not isinstance(moves, array) or moves.typecode != 'H':
+            moves = array('H', moves)
+        if SWAP:
+            moves = array('H', moves)
+            moves.byteswap()
+        block.append(GAME.pack(white, black, player, WINNERS[winner], len(moves)) + moves.tobytes())
+        count += 1
+        if len(block) == BLOCK_GAMES:
+            _write_block(file, block)
+            block = []
+    if block:
+        _write_block(file, block)
+    return count
+
+
+def _write_block(file, games):
+    offsets = array('I')
+    offset = 0
+    for game in games:
+        offsets.append(offset)
+        offset += len(game)
+    if SWAP:
+        offsets.byteswap()
+    file.write(BLOCK.pack(len(games), offset))
+    file.write(offsets.tobytes())
+    file.write(b''.join(games))
+
+
+def _game(data, offset):
+    white, black, player, winner, length = GAME.unpack_from(data, offset)
+    start = offset + GAME.size
+    moves = array('H')
+    moves.frombytes(data[start:start + length * MOVE.size])
+    if SWAP:
+        moves.byteswap()
+    return Game((white, black), bool(player), WINNERS_BY_CODE[winner], moves), start + length * MOVE.size
+
+
+def _read(file, size):
+    data = file.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated game file")
+    return data
+
+
+def read_games(file):
+    """
+    Returns an iterator over the Game records of a binary file object,
+    reading it a block at a time.
+    """
+    _check_header(file.read(HEADER.size), GAMES)
+    while True:
+        header = file.read(BLOCK.size)
+        if not header:
+            break
+        if len(header) != BLOCK.size:
+            raise ValueError("Truncated game file")
+        games, size = BLOCK.unpack(header)
+        _read(file, games * OFFSET.size)
+        data = _read(file, size)
+        offset = 0
+        for _ in range(games):
+            if len(data) - offset < GAME.size:
+                raise ValueError("Corrupt game block")
+            game, offset = _game(data, offset)
+            yield game
+        if offset != size:
+            raise ValueError("Corrupt game block")
+
+############################## RANDOM ACCESS ##############################
+
+class Records(object):
+    """
+    Read-only random access to the records of a file through a memory map.
+    """
+    KIND = None
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty
+            self.file.close()
+            raise ValueError("Not a %s file" % ('position', 'game')[self.KIND])
+        try:
+            _check_header(self.data, self.KIND)
+        except ValueError:
+            self.close()
+            raise
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Positions(Records):
+    KIND = POSITIONS
+
+    def __init__(self, path):
+        super(Positions, self).__init__(path)
+        if (len(self.data) - HEADER.size) % POSITION.size:
+            self.close()
+            raise ValueError("Truncated position file")
+
+    def __len__(self):
+        return (len(self.data) - HEADER.size) // POSITION.size
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        white, black, player = POSITION.unpack_from(self.data, HEADER.size + index * POSITION.size)
+        return Position((white, black), bool(player))
+
+
+class Games(Records):
+    """
+    Games have variable lengths: blocks are found by hopping over the block
+    headers once, and games by the offsets their block stores.
+    """
+    KIND = GAMES
+
+    def __init__(self, path):
+        super(Games, self).__init__(path)
+        # offset of every block, and number of games before it
+        self.blocks = array('Q')
+        self.first = array('Q')
+        count = 0
+        offset = HEADER.size
+        while offset + BLOCK.size <= len(self.data):
+            games, size = BLOCK.unpack_from(self.data, offset)
+            self.blocks.append(offset)
+            self.first.append(count)
+            count += games
+            offset += BLOCK.size + games * OFFSET.size + size
+        self.count = count
+        if offset != len(self.data):
+            self.close()
+            raise ValueError("Truncated game file")
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        block = bisect_right(self.first, index) - 1
+        offset = self.blocks[block]
+        games = BLOCK.unpack_from(self.data, offset)[0]
+        offset += BLOCK.size
+        game, = OFFSET.unpack_from(self.data, offset + (index - self.first[block]) * OFFSET.size)
+        return _game(self.data, offset + games * OFFSET.size + game)[0]
@@ -0,0 +1,391 @@
+"""
+Asyncio game server hosting many engine sessions at once.
+
+Clients connect over TCP on localhost or a Unix socket and exchange one JSON
+object per line. Every request may carry an `id`, echoed in its response:
+
+    {"op": "new", "variant": "mini", "player": "b", "seed": 1}
+        -> {"session": 1, "player": "b", "board": {...}}
+    {"op": "move", "session": 1, "block": [[0, 3], [0, 2]], "direction": [0, -1]}
+        -> {"player": "w", "winner": null, "board": {...}}
+    {"op": "bestmove", "session": 1, "engine": "tt-pvs", "depth": 4,
+     "deadline": 5.0, "play": true}
+        -> {"move": {...}, "score": 0.5, "nodes": 1234, "time": 0.8}
+    {"op": "state", "session": 1}
+    {"op": "close", "session": 1}
+
+Errors are answered as {"error": "..."}. A session belongs to the connection
+which created it and is closed when that connection goes away.
+
+Searches run in a bounded pool of worker processes, one process per slot.
+Every session is pinned to a slot, whose process keeps the session's
+transposition table, capped at SESSION_TABLE_ENTRIES, move ordering tables
+and random generator between searches. MCTS searches only keep the random
+generator: every search grows a new tree. A slot whose process dies is
+given a new one, and the sessions pinned to it start their search state
+afresh. Searches stop on their deadline or as soon as their client
+disconnects, keeping the result of the last completed iteration. Once a
+slot has QUEUE_DEPTH searches running or waiting, new searches on it wait
+for room until their deadline, and each connection stops reading requests
+while it has MAX_IN_FLIGHT of them being answered.
+"""
+import json
+import time
+import random
+import asyncio
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from abalone import config
+from abalone.cli import parse_state, format_move
+from abalone.grid import GEOMETRY
+
+# Searches waiting or running per slot before new ones have to wait
+QUEUE_DEPTH = 2
+# Requests being answered per connection before it stops reading
+MAX_IN_FLIGHT = 4
+# Seconds given to a search without a deadline of its own
+DEADLINE = 10.0
+# Seconds past its deadline after which a search is given up on
+GRACE = 1.0
+# Transposition table entries kept per session by the worker processes
+SESSION_TABLE_ENTRIES = 2**18
+
+ENGINES = ('tt-pvs', 'mcts')
+PLAYERS = {'w': config.WHITE, 'b': config.BLACK}
+NAMES = {config.WHITE: 'w', config.BLACK: 'b'}
+
+################################# WORKERS #################################
+
+# State of the sessions pinned to this worker process
+sessions = {}
+# Job the server asked this worker to abandon
+cancelled = None
+
+
+def initialize(value):
+    global cancelled
+    from abalone.ai import TT
+    cancelled = value
+    TT.initialize_keys()
+
+
+def drop(session):
+    sessions.pop(session, None)
+
+
+def think(session, seed, job, key, variant, player, engine, depth, iterations, deadline):
+    """
+    Searches the best move of a position in a worker process, with the
+    search state of the session. Returns the score, the encoded move and the
+    amount of nodes visited.
+    """
+    from abalone import records
+    from abalone.grid import encode_move
+    from abalone.ai import TT, mcts, ordering
+
+    state = sessions.get(session)
+    if state is None:
+        state = sessions[session] = {'table': {}, 'killers': {}, 'history': {},
+                                     'rng': random.Random(seed)}
+    grid = records.board(key, variant, state['rng'])
+
+    def stop():
+        return time.time() > deadline or cancelled.value == job
+
+    if engine == 'mcts':
+        move = mcts.UCT(grid, iterations, player, stop=stop)
+        return None, encode_move(*move), iterations
+
+    TT.table = state['table']
+    TT.TABLE_ENTRIES = SESSION_TABLE_ENTRIES
+    ordering.killers, ordering.history = state['killers'], state['history']
+    TT.node_count = 0
+    TT.stop = stop
+    try:
+        score, move = TT.search(grid, player, depth)
+    finally:
+        TT.stop = None
+    return score, -1 if move == -1 else encode_move(*move), TT.node_count
+
+################################## SERVER #################################
+
+class ServerError(Exception):
+    pass
+
+
+def check_state(state):
+    """
+    Returns the position of a JSON state sent by a client, checking that its
+    cells are on the grid and hold one marble each.
+    """
+    if not isinstance(state, dict) or not all(isinstance(state.get(key), list)
+                                              for key in ('true', 'false')):
+        raise ServerError("States are objects with the cells of each player, "
+                          "under 'true' and 'false'")
+    for cells in (state['true'], state['false']):
+        for cell in cells:
+            if not (isinstance(cell, list) and len(cell) == 2 and
+                    all(type(coordinate) is int for coordinate in cell)):
+                raise ServerError("Cells are pairs of integers: %s" % (cell,))
+            if tuple(cell) not in GEOMETRY.index:
+                raise ServerError("Cell off the grid: %s" % (cell,))
+    position = parse_state(state)
+    cells = position[config.WHITE] + position[config.BLACK]
+    if len(set(cells)) != len(cells):
+        raise ServerError("Cells hold one marble each")
+    return position
+
+
+class Slot(object):
+    """
+    A worker process of the pool, with the sessions pinned to it.
+    """
+    def __init__(self):
+        self.cancelled = mp.Value('q', -1, lock=False)
+        self.executor = None
+        self.start()
+        self.sessions = 0
+        self.queue = None
+
+    def start(self):
+        self.executor = ProcessPoolExecutor(max_workers=1, initializer=initialize,
+                                            initargs=(self.cancelled,))
+
+    def restart(self):
+        """
+        Replaces a worker process which died, along with the search state of
+        the sessions pinned to it.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.start()
+
+
+class Session(object):
+    def __init__(self, id, slot, board, player, seed):
+        from abalone.grid import AbaloneGrid
+
+        self.id = id
+        self.slot = slot
+        self.variant = config.variant(board)
+        self.grid = AbaloneGrid(config.initial_position(board), self.variant)
+        self.player = player
+        self.seed = seed
+        self.winner = None
+        # serializes the requests which read or change the position
+        self.lock = asyncio.Lock()
+
+    def describe(self):
+        return {'session': self.id, 'player': NAMES[self.player],
+                'winner': NAMES.get(self.winner),
+                'board': {'true': [list(hex) for hex, s in self.grid.items() if s == config.WHITE],
+                          'false': [list(hex) for hex, s in self.grid.items() if s == config.BLACK]}}
+
+    def play(self, block, direction):
+        if any(self.grid.get(hex) != self.player for hex in block):
+            raise ServerError("The block is not the player's to move")
+        self.grid.move(block, direction)
+        if self.grid.query.check_win(self.player):
+            self.winner = self.player
+        self.player = not self.player
+
+
+class Server(object):
+    def __init__(self, workers=None, queue=QUEUE_DEPTH, deadline=DEADLINE):
+        self.slots = [Slot() for _ in range(workers or mp.cpu_count())]
+        self.queue = queue
+        self.deadline = deadline
+        self.sessions = {}
+        self.ids = itertools.count(1)
+        self.jobs = itertools.count(1)
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+        for slot in self.slots:
+            slot.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def serve(self, host='127.0.0.1', port=7777, path=None):
+        """
+        Serves clients until cancelled, on a Unix socket if a path is given
+        and on TCP otherwise.
+        """
+        for slot in self.slots:
+            slot.queue = asyncio.Semaphore(self.queue)
+        if path:
+            server = await asyncio.start_unix_server(self.handle, path=path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+
+    async def handle(self, reader, writer):
+        owned = set()
+        tasks = set()
+        try:
+            while True:
+                # back-pressure: stop reading while too many requests are in flight
+                while len(tasks) >= MAX_IN_FLIGHT:
+                    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.ensure_future(self.respond(line, writer, owned))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            # the client went away: abandon its searches and its sessions
+            for task in tasks:
+                task.cancel()
+            for session in owned:
+                self.close_session(session)
+            writer.close()
+
+    async def respond(self, line, writer, owned):
+        request = {}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ServerError("Requests are JSON objects")
+            op = request.get('op')
+            if op == 'new':
+                response = self.new_session(request, owned)
+            elif op not in ('move', 'bestmove', 'state', 'close'):
+                raise ServerError("Unknown op: %s" % op)
+            else:
+                session = self.sessions.get(request.get('session'))
+                if session is None or session.id not in owned:
+                    raise ServerError("Unknown session: %s" % request.get('session'))
+                if op == 'move':
+                    response = await self.move(session, request)
+                elif op == 'bestmove':
+                    response = await self.bestmove(session, request)
+                elif op == 'state':
+                    response = session.describe()
+                else:
+                    owned.discard(session.id)
+                    self.close_session(session.id)
+                    response = {'session': session.id}
+        except Exception as error:
+            # every request is answered, whatever went wrong
+            response = {'error': str(error) or error.__class__.__name__}
+        if isinstance(request, dict) and 'id' in request:
+            response['id'] = request['id']
+        try:
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    def new_session(self, request, owned):
+        if 'state' in request:
+            board = check_state(request['state'])
+        else:
+            board = request.get('variant', 'mini')
+            if board not in config.INITIAL_POSITIONS:
+                raise ServerError("Unknown variant: %s" % board)
+        slot = min(self.slots, key=lambda slot: slot.sessions)
+        seed = request.get('seed', random.getrandbits(64))
+        session = Session(next(self.ids), slot, board,
+                          PLAYERS[request.get('player', 'b')], seed)
+        slot.sessions += 1
+        self.sessions[session.id] = session
+        owned.add(session.id)
+        return session.describe()
+
+    def close_session(self, id):
+        session = self.sessions.pop(id, None)
+        if session is not None:
+            session.slot.sessions -= 1
+            # the workers are gone once the server is closed
+            if not self.closed:
+                try:
+                    session.slot.executor.submit(drop, id)
+                except BrokenProcessPool:
+                    # its state went with the process
+                    pass
+
+    async def move(self, session, request):
+        from abalone.grid import Hex, HexBlock
+
+        block = HexBlock.aligned(Hex(*hex) for hex in request['block'])
+        direction = tuple(request['direction'])
+        async with session.lock:
+            if session.winner is not None:
+                raise ServerError("The game is over")
+            if not session.grid.is_legal(session.player, block, direction):
+                raise ServerError("Illegal move")
+            session.play(block, direction)
+            return session.describe()
+
+    async def bestmove(self, session, request):
+        """
+        Searches the position of a session, holding the session so that no
+        move changes the position the search is computed for.
+        """
+        engine = request.get('engine', 'tt-pvs')
+        if engine not in ENGINES:
+            raise ServerError("Unknown engine: %s" % engine)
+        async with session.lock:
+            return await self.search(session, request, engine)
+
+    async def search(self, session, request, engine):
+        from abalone.grid import decode_move
+
+        if session.winner is not None:
+            raise ServerError("The game is over")
+        key, player = session.grid.key, session.player
+        start = time.time()
+        deadline = start + float(request.get('deadline', self.deadline))
+        slot = session.slot
+        job = next(self.jobs)
+
+        try:
+            await asyncio.wait_for(slot.queue.acquire(), deadline - time.time())
+        except asyncio.TimeoutError:
+            raise ServerError("Busy: no room for the search before its deadline")
+        try:
+            future = asyncio.get_event_loop().run_in_executor(
+                slot.executor, think, session.id, session.seed, job, key,
+                session.variant, player, engine, int(request.get('depth', 3)),
+                int(request.get('iterations', 100)), deadline)
+            try:
+                score, move, nodes = await asyncio.wait_for(future, deadline + GRACE - time.time())
+            except asyncio.TimeoutError:
+                slot.cancelled.value = job
+                raise ServerError("Deadline exceeded")
+            except asyncio.CancelledError:
+                slot.cancelled.value = job
+                raise
+        except BrokenProcessPool:
+            slot.restart()
+            raise ServerError("The worker process of the session died, search again")
+        finally:
+            slot.queue.release()
+
+        response = {'move': None, 'score': score, 'nodes': nodes, 'time': time.time() - start}
+        if move != -1:
+            move = decode_move(move)
+            response['move'] = format_move(move)
+            if request.get('play'):
+                if session.grid.key != key or session.player != player:
+                    raise ServerError("The position changed during the search")
+                session.play(*move)
+                response.update(session.describe())
+        return response
+
+
+def main(host='127.0.0.1', port=7777, path=None, workers=None, queue=QUEUE_DEPTH,
+         deadline=DEADLINE):
+    server = Server(workers, queue, deadline)
+    try:
+        asyncio.run(server.serve(host, port, path))
+    except KeyboardInterrupt:
+        pass
@@ -18,6 +18,12 @@ setup(
     install_requires=[
         'pyfiglet'
     ],
+    extras_require={
+        'tuning': ['numpy'],
+    },
+    entry_points={
+        'console_scripts': ['abalone=abalone.cli:main'],
+    },
     package_data = {},
     license='GPLv3',
     classifiers=[
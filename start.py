@@ -7,9 +7,11 @@ from pyfiglet import Figlet
 
 from abalone.grid import AbaloneGrid
 import abalone.config as config
+from abalone.cli import load_state
 
 import abalone.ai.AI as ai
 import abalone.ai.TT as tt
+import abalone.ai.ordering as ordering
 import abalone.ai.mcts as mcts
 from timeit import default_timer as timer
 
@@ -19,22 +21,10 @@ print(custom_fig.renderText('Abalone Engine'))
 user = input("Load JSON state or hit enter for simulation (AI vs AI): ")
 
 if user != "":
-    state = None
-    with open(user) as json_file:  
-        state = json.load(json_file)
-    
-    state[True] = state['true']
-    del state['true']
-    state[False] = state['false']
-    del state['false']
-
-    for key in state:
-        for idx, block in enumerate(state[key]):
-            state[key][idx] = tuple(block)
+    state = load_state(user)
 
     # Initialize the grid
-    initial_position = config.initialize(state)
-    grid = AbaloneGrid(initial_position)
+    grid = AbaloneGrid(config.initial_position(state), config.variant(state))
     
     print("Loading state: ", state)
     print("\nState loaded\n")
@@ -50,7 +40,7 @@ if user != "":
 
     # Find best move
     tt.initialize_keys()
-    _, move = tt.pvs(grid, player, -math.inf, math.inf, 5)
+    _, move = tt.search(grid, player, 5)
     grid.move(move[0], move[1])
 
     print(grid.display)
@@ -66,11 +56,11 @@ elif user == "":
         depth = 3
         simulations = 1
         tt.table = {}
-        rnd.seed(4106)
+        ordering.clear()
+        rng = rnd.Random(4106)
 
         # Initialize the grid with the 'mini' opening
-        initial_position = config.initialize('mini')
-        grid = AbaloneGrid(initial_position)
+        grid = AbaloneGrid(config.initial_position('mini'), config.variant('mini'), rng)
 
         print("Black will play as Random AI.\n")
         choice = print("Select an algorithm for White:\n(1) MiniMax \n(2) Alpha-Beta \n(3) PVS \n(4) Alpha-Beta - TT/MO Optimized \n(5) PVS - TT/MO Optimized \n(6) Monte-Carlo Tree Search")
@@ -91,8 +81,8 @@ elif user == "":
             ################## Black ####################
             # move
             curr_white = grid.query.marbles(grid.WHITE, True)
-            moves = list(grid.moves(grid.BLACK, rnd=True, seed=rnd.seed))
-            block, direction = moves[rnd.randint(0, len(moves) - 1)]
+            moves = list(grid.moves(grid.BLACK, rnd=True))
+            block, direction = moves[rng.randint(0, len(moves) - 1)]
             grid.move(block, direction)
 
             # output
@@ -141,7 +131,7 @@ elif user == "":
                 node_count = tt.node_count
             elif alg == "5":
                 tt.initialize_keys()
-                _, move = tt.pvs(grid, grid.WHITE, -math.inf, math.inf, depth)
+                _, move = tt.search(grid, grid.WHITE, depth)
                 accum_node_count += tt.node_count
                 node_count = tt.node_count
             elif alg == "6":
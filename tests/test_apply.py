@@ -0,0 +1,74 @@
+import random
+import unittest
+
+from abalone import config
+from abalone.grid import AbaloneGrid, Hex, HexBlock, encode_move
+
+
+class ApplyTestCase(unittest.TestCase):
+    """
+    Trusted moves (`apply`) must leave the grid exactly as checked moves
+    (`move`) do, occupancy masks included.
+    """
+
+    def assertSameGrid(self, grid, expected):
+        self.assertEqual(dict(grid), dict(expected))
+        self.assertEqual(grid.key, expected.key)
+
+    def play(self, board, games, plies, seed):
+        rng = random.Random(seed)
+        pushes = 0
+        for game in range(games):
+            grid = AbaloneGrid(config.initial_position(board), config.variant(board))
+            player = rng.random() < .5
+            for ply in range(plies):
+                captures = list(grid.captures(player))
+                moves = list(grid.moves(player))
+                pushes += len(captures)
+                for block, direction in moves + captures:
+                    expected = grid.copy()
+                    expected.move(block, direction)
+
+                    # With and without occupancy masks to keep up to date
+                    applied = grid.copy()
+                    applied.apply(encode_move(block, direction))
+                    self.assertSameGrid(applied, expected)
+                    unmasked = AbaloneGrid(grid.deep_copy(raw=True), grid.variant)
+                    unmasked.apply(block, direction)
+                    self.assertSameGrid(unmasked, expected)
+                    self.assertSameGrid(grid.simulate(block, direction, trusted=True), expected)
+
+                # Favour pushes so that games reach sumitos and push-offs
+                if captures and rng.random() < .7:
+                    grid.move(*rng.choice(captures))
+                else:
+                    grid.move(*rng.choice(moves))
+                player = not player
+                if grid.query.check_win(not player):
+                    break
+        self.assertTrue(pushes)
+
+    def test_mini(self):
+        self.play('mini', games=4, plies=60, seed=7)
+
+    def test_standard(self):
+        self.play('standard', games=2, plies=60, seed=11)
+
+    def test_push_off(self):
+        """
+        Pushing a marble off the grid removes it from the grid and its mask.
+        """
+        grid = AbaloneGrid({config.WHITE: [(0, 2), (0, 3)],
+                            config.BLACK: [(0, 4)]}, config.variant('mini'))
+        block = HexBlock((Hex(0, 2), Hex(0, 3)))
+        expected = grid.copy()
+        expected.move(block, (0, 1))
+        self.assertEqual(expected.mask(config.BLACK), 0)
+        applied = grid.copy()
+        applied.mask(config.BLACK)
+        applied.apply(encode_move(block, (0, 1)))
+        self.assertSameGrid(applied, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import random
+import unittest
+
+from abalone import config, grid as abalone_grid
+from abalone.grid import (AbaloneGrid, CELLS, GEOMETRY, Hex, HexBlock,
+                          decode_move, encode_move)
+
+
+class EncodingTestCase(unittest.TestCase):
+    """
+    Encoded moves must decode back to the move they were encoded from.
+    """
+
+    def setUp(self):
+        # Compute codes afresh rather than reading them back from the caches
+        abalone_grid.ENCODED.clear()
+        abalone_grid.DECODED.clear()
+
+    def assertRoundTrip(self, block, direction):
+        code = encode_move(block, direction)
+        self.assertTrue(0 <= code < 1 << 14)
+        decoded_block, decoded_direction = decode_move(code)
+        self.assertEqual(set(decoded_block), set(block))
+        self.assertEqual(decoded_block, HexBlock.aligned(block))
+        self.assertEqual(tuple(decoded_direction), tuple(direction))
+        self.assertEqual(encode_move(decoded_block, decoded_direction), code)
+        return code
+
+    def test_every_block(self):
+        """
+        Every block of the grid, in either order, in every direction.
+        """
+        blocks = [HexBlock((hex,)) for hex in CELLS]
+        blocks.extend(HexBlock(Hex(*cell) for cell in line) for line in GEOMETRY.lines)
+        codes = {}
+        for block in blocks:
+            for direction in Hex.directions:
+                code = self.assertRoundTrip(block, direction)
+                codes.setdefault(code, set()).add((frozenset(block), direction))
+        # Only the two orders of a block share a code
+        self.assertTrue(all(len(moves) == 1 for moves in codes.values()))
+
+    def test_generated_moves(self):
+        """
+        Moves of random games, which the move generator encodes on its own.
+        """
+        rng = random.Random(5)
+        for board in ('mini', 'standard'):
+            grid = AbaloneGrid(config.initial_position(board), config.variant(board))
+            player = config.BLACK
+            for ply in range(40):
+                moves = list(grid.moves(player))
+                codes = list(grid.moves(player, encoded=True))
+                self.assertEqual([encode_move(*move) for move in moves], codes)
+                self.assertEqual(len(set(codes)), len(codes))
+                for move, code in zip(moves, codes):
+                    self.assertEqual(self.assertRoundTrip(*move), code)
+                grid.move(rng.choice(codes))
+                player = not player
+
+
+if __name__ == '__main__':
+    unittest.main()
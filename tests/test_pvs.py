@@ -0,0 +1,84 @@
+import math
+import random
+import unittest
+
+from abalone import config
+from abalone.grid import AbaloneGrid, GEOMETRY
+from abalone.ai import TT, ordering
+
+
+def negamax(board, maximizer, depth):
+    """
+    Plain negamax over every move, scored as TT.pvs scores positions.
+    """
+    if board.query.check_win(not maximizer):
+        return -math.inf
+    if depth == 0:
+        score = TT.heuristic(board)
+        return score if maximizer else -score
+    return max(-negamax(board.simulate(*move, trusted=True), not maximizer, depth - 1)
+               for move in list(board.moves(maximizer)))
+
+
+class PVSTestCase(unittest.TestCase):
+    """
+    Without forward pruning or quiescence, principal variation search with
+    its transposition table, move ordering and aspiration windows must score
+    positions exactly as plain negamax does.
+    """
+
+    def setUp(self):
+        self.settings = TT.QUIESCENCE, TT.NULL_MOVE, TT.LATE_MOVE_REDUCTION
+        TT.QUIESCENCE = TT.NULL_MOVE = TT.LATE_MOVE_REDUCTION = False
+        TT.initialize_keys()
+
+    def tearDown(self):
+        TT.QUIESCENCE, TT.NULL_MOVE, TT.LATE_MOVE_REDUCTION = self.settings
+        TT.table = {}
+        ordering.clear()
+
+    def positions(self, count, seed):
+        """
+        Random positions of a few marbles each, far enough from the end of
+        the game for captures to matter.
+        """
+        rng = random.Random(seed)
+        variant = config.Variant('custom', 0)
+        for _ in range(count):
+            white, black = rng.randint(2, 4), rng.randint(2, 4)
+            cells = rng.sample(GEOMETRY.cells, white + black)
+            yield AbaloneGrid({config.WHITE: cells[:white],
+                               config.BLACK: cells[white:]}, variant), rng.random() < .5
+
+    def assertSameScore(self, score, expected):
+        if math.isinf(expected):
+            self.assertEqual(score, expected)
+        else:
+            self.assertAlmostEqual(score, expected, places=9)
+
+    def test_pvs(self):
+        for board, player in self.positions(12, seed=5):
+            for depth in (1, 2, 3):
+                expected = negamax(board, player, depth)
+                TT.table = {}
+                ordering.clear()
+                score, move = TT.pvs(board, player, -math.inf, math.inf, depth)
+                self.assertSameScore(score, expected)
+                if expected == -math.inf:
+                    # Every move loses, none is picked
+                    continue
+                # The move picked scores as much
+                child = board.simulate(*move, trusted=True)
+                self.assertSameScore(-negamax(child, not player, depth - 1), expected)
+
+    def test_search(self):
+        for board, player in self.positions(8, seed=13):
+            expected = negamax(board, player, 3)
+            TT.table = {}
+            ordering.clear()
+            score, move = TT.search(board, player, 3)
+            self.assertSameScore(score, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from abalone import config, records
+from abalone.grid import AbaloneGrid
+
+
+class RecordsTestCase(unittest.TestCase):
+    """
+    Positions and games must read back, streamed or by index, as they were
+    written, and damaged files must be refused.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.rng = random.Random(1)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def games(self, count):
+        """
+        Random games of the standard variant, some of them without moves,
+        along with their final positions.
+        """
+        games = []
+        for _ in range(count):
+            grid = AbaloneGrid(config.initial_position('standard'), config.variant('standard'))
+            key, player, moves = grid.key, self.rng.random() < .5, []
+            mover = player
+            for _ in range(self.rng.randrange(0, 30)):
+                move = self.rng.choice(list(grid.moves(mover)))
+                moves.append(move)
+                grid.move(*move)
+                mover = not mover
+            winner = self.rng.choice((None, config.WHITE, config.BLACK))
+            games.append((records.record(key, player, moves, winner), grid.key))
+        return games
+
+    def positions(self, count):
+        positions = []
+        for _ in range(count):
+            grid = AbaloneGrid(config.initial_position('mini'), config.variant('mini'))
+            player = self.rng.random() < .5
+            for _ in range(self.rng.randrange(0, 10)):
+                grid.move(*self.rng.choice(list(grid.moves(player))))
+                player = not player
+            positions.append(records.position(grid, player))
+        return positions
+
+    def write(self, name, data):
+        with open(self.path(name), 'wb') as file:
+            file.write(data)
+        return self.path(name)
+
+    def test_positions(self):
+        positions = self.positions(200)
+        with open(self.path('positions'), 'wb') as file:
+            self.assertEqual(records.write_positions(file, positions), len(positions))
+
+        # Chunks which split records
+        for chunk in (1, records.POSITION.size + 3, 1 << 20):
+            with open(self.path('positions'), 'rb') as file:
+                self.assertEqual(list(records.read_positions(file, chunk)), positions)
+
+        with records.Positions(self.path('positions')) as stored:
+            self.assertEqual(len(stored), len(positions))
+            self.assertEqual(list(stored), positions)
+            for index in (0, 17, -1, -len(positions)):
+                self.assertEqual(stored[index], positions[index])
+            for index in (len(positions), -len(positions) - 1):
+                with self.assertRaises(IndexError):
+                    stored[index]
+
+    def test_games(self):
+        games = self.games(40)
+        with mock.patch.object(records, 'BLOCK_GAMES', 6):
+            with open(self.path('games'), 'wb') as file:
+                self.assertEqual(records.write_games(file, (game for game, final in games)),
+                                 len(games))
+        expected = [game for game, final in games]
+
+        with open(self.path('games'), 'rb') as file:
+            self.assertEqual(list(records.read_games(file)), expected)
+
+        with records.Games(self.path('games')) as stored:
+            self.assertEqual(len(stored.blocks), 7)
+            self.assertEqual(len(stored), len(games))
+            self.assertEqual(list(stored), expected)
+            # Both ends of every block, from either end of the file
+            for index in range(-len(games), len(games)):
+                self.assertEqual(stored[index], expected[index])
+            for index in (len(games), -len(games) - 1):
+                with self.assertRaises(IndexError):
+                    stored[index]
+
+            for index, (game, final) in enumerate(games[:5]):
+                grid, player = list(records.replay(stored[index]))[-1]
+                self.assertEqual(grid.key, final)
+                self.assertEqual(player, game.player != (len(game.moves) % 2 == 1))
+
+    def test_empty_files(self):
+        with open(self.path('games'), 'wb') as file:
+            records.write_games(file, [])
+        with records.Games(self.path('games')) as stored:
+            self.assertEqual(len(stored), 0)
+        with open(self.path('positions'), 'wb') as file:
+            records.write_positions(file, [])
+        with records.Positions(self.path('positions')) as stored:
+            self.assertEqual(list(stored), [])
+
+    def test_truncated_positions(self):
+        with open(self.path('positions'), 'wb') as file:
+            records.write_positions(file, self.positions(20))
+        with open(self.path('positions'), 'rb') as file:
+            data = file.read()
+        path = self.write('truncated', data[:-5])
+        with self.assertRaises(ValueError):
+            with open(path, 'rb') as file:
+                list(records.read_positions(file, chunk=64))
+        with self.assertRaises(ValueError):
+            records.Positions(path)
+
+    def test_truncated_games(self):
+        with mock.patch.object(records, 'BLOCK_GAMES', 4):
+            with open(self.path('games'), 'wb') as file:
+                records.write_games(file, (game for game, final in self.games(10)))
+        with open(self.path('games'), 'rb') as file:
+            data = file.read()
+        first = records.BLOCK.unpack_from(data, records.HEADER.size)
+        block = records.BLOCK.size + first[0] * records.OFFSET.size + first[1]
+        # Within a block header, its offsets, its games and the last game
+        for end in (records.HEADER.size + 3, records.HEADER.size + records.BLOCK.size + 2,
+                    records.HEADER.size + block - 1, len(data) - 1):
+            path = self.write('truncated', data[:end])
+            with self.assertRaises(ValueError):
+                with open(path, 'rb') as file:
+                    list(records.read_games(file))
+            with self.assertRaises(ValueError):
+                records.Games(path)
+
+    def test_not_records(self):
+        for data in (b'', b'ABLN'):
+            path = self.write('short', data)
+            with self.assertRaises(ValueError):
+                records.Games(path)
+            with self.assertRaises(ValueError):
+                with open(path, 'rb') as file:
+                    list(records.read_positions(file))
+
+    def test_wrong_kind(self):
+        with open(self.path('positions'), 'wb') as file:
+            records.write_positions(file, self.positions(3))
+        with self.assertRaises(ValueError):
+            records.Games(self.path('positions'))
+        with self.assertRaises(ValueError):
+            with open(self.path('positions'), 'rb') as file:
+                list(records.read_games(file))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+import os
+import sys
+import shutil
+import functools
+import tempfile
+import unittest
+import subprocess
+from array import array
+
+from abalone import config, records
+from abalone.ai import tablebase
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Classes of the small grid, up to three marbles a side in games ending at one
+SMALL_RADIUS = 2
+SMALL_GAME_OVER = 1
+SMALL_CLASS = (3, 3)
+
+
+class TablebaseTestCase(unittest.TestCase):
+    """
+    Tablebases of the grid in use. Generating any of its classes takes
+    minutes, so results are checked on a smaller grid, in a process of its
+    own.
+    """
+
+    def tearDown(self):
+        tablebase.unload()
+
+    def test_index(self):
+        """
+        The index numbers the positions of a class, with either player to
+        move, without gaps or collisions.
+        """
+        for white, black in ((1, 1), (2, 1), (1, 2)):
+            indices = sorted(tablebase.index(key, player)
+                             for key in tablebase.positions(white, black)
+                             for player in (config.BLACK, config.WHITE))
+            self.assertEqual(indices, list(range(2 * tablebase.size(white, black))))
+
+    def test_class_too_large(self):
+        with self.assertRaises(ValueError):
+            tablebase.generate(3, 3, config.variant('mini').game_over)
+
+    def test_game_already_over(self):
+        with self.assertRaises(ValueError):
+            tablebase.build(2, 1, 2, tempfile.mkdtemp())
+
+    def test_load(self):
+        """
+        Damaged files and files of other grids are skipped, and probing stays
+        off until enabled.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        results = [tablebase.WIN | 1 << 2] * (2 * tablebase.size(1, 1))
+        target = tablebase.write(array('H', results), 1, 1, 0, directory)
+        with open(target, 'rb') as table:
+            data = table.read()
+        with open(tablebase.path(2, 1, 0, directory), 'wb') as table:
+            table.write(data[:-2])
+        with open(tablebase.path(1, 2, 0, directory), 'wb') as table:
+            pass
+        with open(os.path.join(directory, 'r%d-g0-1v1.tb' % (config.GRID_RADIUS + 1)), 'wb') as table:
+            table.write(data)
+
+        self.assertEqual(tablebase.load(directory), 1)
+        self.assertFalse(tablebase.PROBE)
+        table = tablebase.tables[1, 1, 0]
+        self.assertEqual(len(table), len(results))
+        self.assertEqual(table[len(results) - 1], results[-1])
+
+        tablebase.unload()
+        self.assertEqual(tablebase.enable(directory), 1)
+        self.assertTrue(tablebase.PROBE)
+
+    def test_small_grid(self):
+        """
+        Runs SmallGridTestCase on a grid of radius SMALL_RADIUS.
+        """
+        script = ('from abalone import config; config.GRID_RADIUS = %d; import unittest; '
+                  'unittest.main(module="tests.test_tablebase", argv=["tablebase", "SmallGridTestCase"])'
+                  % SMALL_RADIUS)
+        process = subprocess.run([sys.executable, '-c', script], cwd=ROOT,
+                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                 universal_newlines=True)
+        self.assertEqual(process.returncode, 0, process.stdout)
+        self.assertNotIn('skipped', process.stdout)
+
+
+@unittest.skipUnless(config.GRID_RADIUS == SMALL_RADIUS,
+                     "run by TablebaseTestCase.test_small_grid")
+class SmallGridTestCase(unittest.TestCase):
+    """
+    Generated results against an exhaustive search of every position of the
+    classes of a small grid.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.variant = config.Variant('custom', SMALL_GAME_OVER)
+        tablebase.build(*SMALL_CLASS, game_over=SMALL_GAME_OVER, directory=cls.directory)
+        tablebase.PROBE = True
+
+    @classmethod
+    def tearDownClass(cls):
+        tablebase.unload()
+        shutil.rmtree(cls.directory)
+
+    @functools.lru_cache(maxsize=None)
+    def solve(self, key, player, depth):
+        """
+        1 if the player to move wins within depth plies, -1 if it loses
+        within them, 0 otherwise. A player left without moves has lost.
+        """
+        board = records.board(key, self.variant)
+        moves = list(board.moves(player, encoded=True))
+        if not moves:
+            return -1
+        if depth == 0:
+            return 0
+        best = -1
+        for move in moves:
+            child = board.simulate(move, trusted=True)
+            if child.query.check_win(player):
+                return 1
+            best = max(best, -self.solve(child.key, not player, depth - 1))
+            if best == 1:
+                break
+        return best
+
+    def results(self):
+        for (white, black, game_over), table in sorted(tablebase.tables.items()):
+            for key in tablebase.positions(white, black):
+                for player in (config.BLACK, config.WHITE):
+                    result = table[tablebase.index(key, player)]
+                    yield key, player, result & 3, result >> 2
+
+    def test_outcomes(self):
+        self.assertEqual(len(tablebase.tables), (SMALL_CLASS[0] - SMALL_GAME_OVER) *
+                         (SMALL_CLASS[1] - SMALL_GAME_OVER))
+        results = list(self.results())
+        longest = max(distance for key, player, outcome, distance in results)
+        # Results beyond immediate captures
+        self.assertGreater(longest, 5)
+        for key, player, outcome, distance in results:
+            if outcome == tablebase.DRAW:
+                # Nothing forced in longer than any result
+                self.assertEqual(self.solve(key, player, longest + 2), 0, (key, player))
+                continue
+            expected = 1 if outcome == tablebase.WIN else -1
+            # No sooner than the distance, the loser having no way out
+            self.assertEqual(self.solve(key, player, distance), expected, (key, player))
+            if distance >= 2:
+                self.assertNotEqual(self.solve(key, player, distance - 2), expected,
+                                    (key, player))
+
+    def test_best_move(self):
+        for key, player, outcome, distance in self.results():
+            board = records.board(key, self.variant)
+            found = tablebase.best_move(board, player)
+            if outcome == tablebase.LOSS and distance == 0:
+                self.assertIsNone(found)
+                continue
+            score, move = found
+            self.assertEqual(score, tablebase.score(board, player))
+            child = board.simulate(*move, trusted=True)
+            if child.query.check_win(player):
+                self.assertEqual((outcome, distance), (tablebase.WIN, 1))
+                continue
+            reply = tablebase.probe(child, not player)
+            if outcome == tablebase.DRAW:
+                self.assertEqual(reply[0], tablebase.DRAW)
+            else:
+                # The quickest win, or the slowest loss
+                self.assertEqual(reply, ((tablebase.LOSS if outcome == tablebase.WIN
+                                          else tablebase.WIN), distance - 1))
+
+
+if __name__ == '__main__':
+    unittest.main()